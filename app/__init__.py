@@ -10,16 +10,24 @@ login_manager = LoginManager()
 csrf = CSRFProtect()
 
 
-def create_app():
+def create_app(config_name=None):
     app = Flask(__name__)
 
-    # Configuration
-    app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
-    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///budget.db')
-    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Configuration: the config.py class named by FLASK_ENV (the non-debug base
+    # Config when unset); a misspelt name must not quietly fall back to it
+    from config import config, engine_options
+    config_name = config_name or os.environ.get('FLASK_ENV') or 'default'
+    if config_name not in config:
+        raise ValueError(f'Unknown FLASK_ENV {config_name!r}; use one of {", ".join(sorted(config))}.')
+    app.config.from_object(config[config_name])
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
 
     # Initialize extensions
     db.init_app(app)
+    from app import engine, metrics, sqlstats
+    engine.init_app(app)
+    sqlstats.init_app(app)
+    metrics.init_app(app)
     csrf.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
@@ -33,9 +41,11 @@ def create_app():
     from app.routes.auth import bp as auth_bp
     from app.routes.house import bp as house_bp
     from app.routes.todos import bp as todos_bp
+    from app.routes.search import bp as search_bp
     app.register_blueprint(auth_bp)
     app.register_blueprint(house_bp)
     app.register_blueprint(todos_bp)
+    app.register_blueprint(search_bp)
 
     # Simple home and health routes
     @app.route('/')
@@ -45,14 +55,16 @@ def create_app():
 
     @app.route('/health')
     def health():
-        return {'status': 'healthy', 'database': 'connected'}
+        from app.health import health_report
+        return health_report()
 
     # CLI command: flask init-db
     @app.cli.command('init-db')
     def init_db():
         """Create all tables and seed required data."""
         from app.models import HouseProject
-        db.create_all()
+        from app.migrations import upgrade
+        upgrade()
         click.echo('Tables created.')
 
         # Seed the "General House Expenses" project if it doesn't exist
@@ -69,6 +81,106 @@ def create_app():
         else:
             click.echo('"General House Expenses" project already exists.')
 
+    # CLI command: flask upgrade-db
+    @app.cli.command('upgrade-db')
+    def upgrade_db():
+        """Create missing tables and apply pending schema migrations."""
+        from app.migrations import upgrade
+        applied = upgrade()
+        for version, name in applied:
+            click.echo(f'Applied migration {version}: {name}')
+        if not applied:
+            click.echo('Database is up to date.')
+
+    # CLI command: flask rebuild-rollups
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups():
+        """Recompute the expense_rollups table from the expense ledger."""
+        from app import cache, rollups
+        rollups.rebuild()
+        cache.bump_version(cache.EXPENSE_YEARS, cache.DATA)
+        db.session.commit()
+        click.echo('Expense rollups rebuilt.')
+
+    # CLI command: flask rebuild-search
+    @app.cli.command('rebuild-search')
+    def rebuild_search():
+        """Recreate the full-text search documents from the expense, project and to-do tables."""
+        from app import search
+        search.rebuild()
+        db.session.commit()
+        click.echo('Search index rebuilt.')
+
+    # CLI command: flask seed-synthetic
+    @app.cli.command('seed-synthetic')
+    @click.option('--expenses', default=100000, show_default=True, help='Expenses to generate.')
+    @click.option('--projects', default=40, show_default=True, help='Projects to generate.')
+    @click.option('--retailers', default=60, show_default=True, help='Retailers to generate.')
+    @click.option('--todos', default=500, show_default=True, help='To-dos to generate.')
+    @click.option('--seed', default=0, show_default=True, help='Random seed; with a fixed --until, the same seed gives the same data.')
+    @click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+                  help='Last expense date (default today); set it for reproducible data.')
+    @click.option('--years', default=5, show_default=True, help='Years of history before --until.')
+    def seed_synthetic(expenses, projects, retailers, todos, seed, until, years):
+        """Bulk-insert realistic synthetic data for load testing."""
+        import time
+        from app.synthetic import seed_synthetic
+        started = time.perf_counter()
+
+        def progress(done):
+            if done % 100000 == 0 or done == expenses:
+                click.echo(f'  {done} expenses ({time.perf_counter() - started:.1f}s)')
+
+        try:
+            seed_synthetic(expenses, projects, retailers, todos, seed=seed,
+                           until=until.date() if until else None, years=years, progress=progress)
+        except ValueError as exc:
+            raise click.ClickException(str(exc))
+        click.echo(f'Generated {expenses} expenses, {projects} projects, {retailers} retailers '
+                   f'and {todos} to-dos in {time.perf_counter() - started:.1f}s.')
+
+    # CLI command: flask rebalance-todos
+    @app.cli.command('rebalance-todos')
+    def rebalance_todos():
+        """Rewrite all to-do ranks as short, evenly spaced keys."""
+        from app.ranks import rebalance_todos
+        count = rebalance_todos()
+        click.echo(f'Rebalanced {count} to-do ranks.')
+
+    # CLI command: flask explain-tally
+    @app.cli.command('explain-tally')
+    @click.option('--year', type=int)
+    @click.option('--month', type=int)
+    @click.option('--quarter', type=int)
+    @click.option('--repeat', default=20, show_default=True, help='Timed runs per query.')
+    def explain_tally(year, month, quarter, repeat):
+        """Compare query plans and timings of extract() vs date-range Tally filters."""
+        import time
+        from sqlalchemy import extract, func, true
+        from app.models import HouseExpense
+        from app.queries import expense_criteria, explain
+
+        legacy = [HouseExpense.is_active == true()]
+        if year:
+            legacy.append(extract('year', HouseExpense.expenditure_date) == year)
+        if month:
+            legacy.append(extract('month', HouseExpense.expenditure_date) == month)
+        if quarter:
+            start_month = (quarter - 1) * 3 + 1
+            legacy.append(extract('month', HouseExpense.expenditure_date) >= start_month)
+            legacy.append(extract('month', HouseExpense.expenditure_date) <= start_month + 2)
+
+        for label, criteria in [('extract()', legacy),
+                                ('date range', expense_criteria(year=year, month=month, quarter=quarter))]:
+            query = db.session.query(func.count(HouseExpense.id)).filter(*criteria)
+            started = time.perf_counter()
+            for _ in range(repeat):
+                count = query.scalar()
+            elapsed = (time.perf_counter() - started) / repeat * 1000
+            click.echo(f'== {label}: {count} rows, {elapsed:.2f} ms/query')
+            for line in explain(query):
+                click.echo(f'   {line}')
+
     # CLI command: flask create-user
     @app.cli.command('create-user')
     @click.argument('username')
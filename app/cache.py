@@ -0,0 +1,167 @@
+"""Per-process caches invalidated by version counters stored in the database.
+
+Every gunicorn worker keeps its own copy of a cached value. Writers call
+bump_version() in the same transaction as their change; readers compare the
+counter in cache_versions with the version their copy was built from, so all
+workers pick up the change on their next request. The counters are read with
+one query per request.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+from flask import g, has_app_context
+from sqlalchemy import insert, select, true, update
+from sqlalchemy.exc import IntegrityError
+from app import db, metrics, queries
+from app.models import CacheVersion, HouseProject, Retailer
+
+# Bumped by the project and retailer add, edit and delete routes
+CHOICES = 'choices'
+# Bumped when a year gains its first active expense or loses its last one
+EXPENSE_YEARS = 'expense_years'
+# Bumped by every expense, project and retailer write; versions cached Tally pages
+DATA = 'data'
+
+Choice = namedtuple('Choice', 'id name')
+
+_entries = {}  # cache key -> (version, value)
+
+
+def _versions():
+    if has_app_context() and 'cache_versions' in g:
+        return g.cache_versions
+    versions = dict(db.session.execute(select(CacheVersion.name, CacheVersion.version)).all())
+    if has_app_context():
+        g.cache_versions = versions
+    return versions
+
+
+def get_version(name):
+    return _versions().get(name, 0)
+
+
+def bump_version(*names):
+    """Increment the named counters as part of the current transaction."""
+    versions = _versions()
+    for name in names:
+        result = db.session.execute(
+            update(CacheVersion).where(CacheVersion.name == name)
+            .values(version=CacheVersion.version + 1)
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(CacheVersion).values(name=name, version=1))
+            except IntegrityError:
+                # Another worker created the counter first
+                db.session.execute(
+                    update(CacheVersion).where(CacheVersion.name == name)
+                    .values(version=CacheVersion.version + 1)
+                    .execution_options(synchronize_session=False)
+                )
+        versions[name] = versions.get(name, 0) + 1
+
+
+def cached(key, version_name, loader):
+    """Return loader()'s value, reusing this process's copy while the version is unchanged."""
+    version = get_version(version_name)
+    entry = _entries.get(key)
+    hit = entry is not None and entry[0] == version
+    metrics.cache_lookup(key, hit)
+    if hit:
+        return entry[1]
+    value = loader()
+    _entries[key] = (version, value)
+    return value
+
+
+class LRUCache:
+    """A bounded, thread-safe mapping that evicts the least recently used entry.
+
+    Counts hits and misses so the hit rate can be checked in production; they
+    are also exported from /metrics under name.
+    """
+
+    def __init__(self, maxsize, name='lru'):
+        self.maxsize = maxsize
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value for key, or None on a miss."""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+        metrics.cache_lookup(self.name, value is not None)
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+# ---------------------------------------------------------------------------
+# Select-choice providers
+# ---------------------------------------------------------------------------
+
+def project_choices():
+    """Active projects as (id, name) pairs, ordered by name."""
+    return cached('project_choices', CHOICES, lambda: [
+        Choice(*row) for row in db.session.execute(
+            select(HouseProject.id, HouseProject.name)
+            .where(HouseProject.is_active == true())
+            .order_by(HouseProject.name)
+        )
+    ])
+
+
+def retailer_choices():
+    """Active retailers as (id, name) pairs, ordered by name."""
+    return cached('retailer_choices', CHOICES, lambda: [
+        Choice(*row) for row in db.session.execute(
+            select(Retailer.id, Retailer.name)
+            .where(Retailer.is_active == true())
+            .order_by(Retailer.name)
+        )
+    ])
+
+
+# ---------------------------------------------------------------------------
+# Expense years
+# ---------------------------------------------------------------------------
+
+def expense_years():
+    """Years with active expenses, newest first."""
+    return cached('expense_years', EXPENSE_YEARS, queries.years_with_expenses)
+
+
+def sync_expense_years(years, years_before):
+    """Bump EXPENSE_YEARS if any of years gained its first or lost its last active expense.
+
+    years_before is queries.years_with_expenses(years) read in the same
+    transaction before the rollup deltas were applied. Both sides come from
+    the database, never from this worker's cached expense_years(), which may
+    be missing or stale.
+    """
+    years = set(years)
+    if years and set(queries.years_with_expenses(years)) != set(years_before):
+        bump_version(EXPENSE_YEARS)
@@ -0,0 +1,86 @@
+"""Conditional GET (ETag / Last-Modified) support for the list pages.
+
+A page's validator is built from max(updated_at) and the row count of its
+table, plus whatever else the page shows: the filter arguments, cache
+version counters for related data, and the user. When the browser's
+If-None-Match still matches, the route answers 304 Not Modified without
+rendering anything.
+
+Rendered pages embed CSRF tokens, which expire after WTF_CSRF_TIME_LIMIT.
+The validator therefore also includes the session's CSRF secret and a time
+bucket shorter than that limit, so a page revalidated from the browser cache
+never carries an expired token.
+"""
+import hashlib
+import time
+from collections import namedtuple
+from flask import make_response, request, session
+from flask_login import current_user
+from flask_wtf.csrf import generate_csrf
+from sqlalchemy import func, select
+from app import db
+
+# Seconds a validator stays valid at most; keep below WTF_CSRF_TIME_LIMIT (3600)
+VALIDATOR_WINDOW = 30 * 60
+
+Validators = namedtuple('Validators', 'etag last_modified')
+
+
+def table_stamp(model):
+    """Return (max(updated_at), row count) for a model's table in one query."""
+    return db.session.execute(select(func.max(model.updated_at), func.count(model.id))).one()
+
+
+def page_validators(model, *parts):
+    """Return the Validators for a page listing model, or None if it can't be cached.
+
+    parts are any further values the page depends on, e.g. request.args and
+    cache versions. Pages that will render a pending flash message get none.
+    """
+    if '_flashes' in session:
+        return None
+    # Makes sure the session holds its CSRF secret before it is read below
+    generate_csrf()
+    last_modified, row_count = table_stamp(model)
+    key = repr((
+        request.endpoint, current_user.get_id(), session.get('csrf_token'),
+        int(time.time() // VALIDATOR_WINDOW),
+        last_modified.isoformat() if last_modified else None, row_count, parts,
+    ))
+    return Validators(hashlib.sha1(key.encode()).hexdigest(), last_modified)
+
+
+def data_validators(*parts):
+    """Return the Validators for a JSON response that depends only on parts.
+
+    Unlike page_validators() there is no table to stamp: parts must include a
+    cache version that every relevant write bumps.
+    """
+    key = repr((request.endpoint, parts))
+    return Validators(hashlib.sha1(key.encode()).hexdigest(), None)
+
+
+def not_modified(validators):
+    """Return a 304 response if the browser's copy still matches, else None."""
+    if validators is None or validators.etag not in request.if_none_match:
+        return None
+    response = make_response('', 304)
+    _set_headers(response, validators)
+    return response
+
+
+def conditional_response(body, validators):
+    """Wrap a rendered page in a response carrying its validators."""
+    response = make_response(body)
+    if validators is not None:
+        _set_headers(response, validators)
+    return response
+
+
+def _set_headers(response, validators):
+    response.set_etag(validators.etag)
+    if validators.last_modified is not None:
+        response.last_modified = validators.last_modified
+    # Browsers may keep the page but must revalidate it on every load
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
@@ -0,0 +1,49 @@
+"""Per-connection tuning of the database engine.
+
+Postgres is tuned through SQLALCHEMY_ENGINE_OPTIONS (config.engine_options()).
+SQLite settings are per connection, so they are applied with PRAGMAs from a
+connect event on every connection the pool opens.
+
+On Postgres, DB_STATEMENT_TIMEOUT_MS is set with SET LOCAL on each session
+transaction begun during a web request. CLI commands such as migrations and
+the rollup and search rebuilds run long statements on purpose and get no
+timeout.
+"""
+from flask import current_app, has_request_context
+from sqlalchemy import event
+from app import db
+
+
+def sqlite_pragmas(config):
+    return [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+    ]
+
+
+def _statement_timeout(session, transaction, connection):
+    if not has_request_context() or connection.dialect.name != 'postgresql':
+        return
+    timeout_ms = int(current_app.config['DB_STATEMENT_TIMEOUT_MS'])
+    if timeout_ms:
+        connection.exec_driver_sql(f'SET LOCAL statement_timeout = {timeout_ms}')
+
+
+def init_app(app):
+    """Apply the SQLite PRAGMAs on connect and the Postgres statement timeout per request."""
+    pragmas = sqlite_pragmas(app.config)
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', set_pragmas)
+    if not event.contains(db.session, 'after_begin', _statement_timeout):
+        event.listen(db.session, 'after_begin', _statement_timeout)
@@ -1,4 +1,5 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileAllowed, FileField, FileRequired
 from wtforms import (
     StringField, TextAreaField, DecimalField, DateField,
     SelectField, URLField, BooleanField, PasswordField
@@ -76,3 +77,24 @@ class HouseExpenseForm(FlaskForm):
     project_id = SelectField('Project', coerce=int, validators=[DataRequired()])
     retailer_id = SelectField('Retailer', coerce=int, validators=[Optional()])
     description = TextAreaField('Description / Notes', validators=[Optional()])
+
+
+class ExpenseImportForm(FlaskForm):
+    file = FileField('Statement file', validators=[
+        FileRequired(), FileAllowed(['csv', 'ofx', 'qfx'], 'Upload a .csv, .ofx or .qfx file.'),
+    ])
+    project_id = SelectField('Project', coerce=int, validators=[DataRequired()])
+    category = SelectField(
+        'Category',
+        choices=[(c, c) for c in HOUSE_EXPENSE_CATEGORIES],
+        default='Other',
+        description='Used for rows without a recognised category column',
+    )
+    charge_sign = SelectField(
+        'Amount sign',
+        choices=[(1, 'Charges are positive, payments negative'), (-1, 'Charges are negative, payments positive')],
+        coerce=int,
+        default=1,
+        description='For CSV files with one amount column; payments and refunds are skipped',
+    )
+    create_retailers = BooleanField('Add retailers that don\'t exist yet', default=True)
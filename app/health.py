@@ -0,0 +1,59 @@
+"""The /health check: a timed database round trip plus connection pool status.
+
+The SELECT 1 runs on a background thread so the check answers within
+HEALTH_TIMEOUT_SECONDS even when the database or the pool is stuck; on
+Postgres a statement_timeout also stops the query itself. The check reports
+503 when the database can't be reached, doesn't answer in time, or answers
+slower than HEALTH_MAX_LATENCY_MS, so Docker and the load balancer can take
+the worker out of rotation.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+
+# One thread per worker; a check stuck behind a hung one times out as well
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='health')
+
+
+def _round_trip(engine, timeout_ms):
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        if conn.dialect.name == 'postgresql':
+            conn.execute(text(f'SET LOCAL statement_timeout = {int(timeout_ms)}'))
+        conn.execute(text('SELECT 1'))
+    return (time.perf_counter() - started) * 1000
+
+
+def pool_status(engine):
+    """Size, checked-out connections and overflow of the engine's pool, where it has them."""
+    pool = engine.pool
+    status = {'class': type(pool).__name__}
+    for key, method in (('size', 'size'), ('checked_out', 'checkedout'),
+                        ('checked_in', 'checkedin'), ('overflow', 'overflow')):
+        if hasattr(pool, method):
+            status[key] = getattr(pool, method)()
+    return status
+
+
+def health_report():
+    """Return (body, HTTP status) for /health."""
+    timeout = current_app.config['HEALTH_TIMEOUT_SECONDS']
+    max_latency = current_app.config['HEALTH_MAX_LATENCY_MS']
+    engine = db.engine
+    body = {'status': 'healthy', 'database': 'connected', 'latency_ms': None}
+    try:
+        latency = _executor.submit(_round_trip, engine, timeout * 1000).result(timeout=timeout)
+    except TimeoutError:
+        body.update(status='unhealthy', database='timeout')
+    except SQLAlchemyError as exc:
+        body.update(status='unhealthy', database='unreachable', error=type(exc).__name__)
+    else:
+        body['latency_ms'] = round(latency, 2)
+        if latency > max_latency:
+            body.update(status='degraded', database='slow')
+    body['max_latency_ms'] = max_latency
+    body['pool'] = pool_status(engine)
+    return body, 200 if body['status'] == 'healthy' else 503
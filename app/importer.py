@@ -0,0 +1,278 @@
+"""Bulk import of expenses from bank and card statements (CSV or OFX).
+
+Files are parsed as a stream, one transaction at a time, so a large statement
+never has to fit in memory. Rows are inserted with Core executemany in batches
+of IMPORT_BATCH_SIZE, each batch committed together with its rollup deltas
+and cache version bumps. Rows that can't be parsed are skipped and reported
+with their line number; they never abort the rest of the import.
+
+Only charges become expenses; payments, refunds and other credits are
+skipped. Banks disagree on the sign of a charge in a CSV amount column, so
+the uploader says which sign charges have. CSVs with separate debit and
+credit columns need no sign: debit rows are charges and credit rows are
+skipped. OFX amounts are always negative for debits.
+"""
+import csv
+import io
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from app import cache, db, rollups, search
+from app.models import HOUSE_EXPENSE_CATEGORIES, HouseExpense, Retailer, expense_amounts, normalize_retailer_name
+from app.retailers import resolve_retailer
+
+# Rows inserted and committed per transaction
+IMPORT_BATCH_SIZE = 2000
+# Per-row errors kept for the report; the rest are only counted
+MAX_REPORTED_ERRORS = 200
+
+# CSV header names (lower-cased) accepted for each field, in order of preference
+CSV_HEADERS = {
+    'date': ['date', 'transaction date', 'trans. date', 'posted date', 'post date', 'purchase date'],
+    'item': ['item', 'description', 'name'],
+    'amount': ['price', 'amount', 'debit'],
+    'credit': ['credit'],
+    'tax': ['tax'],
+    'category': ['category'],
+    'retailer': ['retailer', 'merchant', 'store', 'payee'],
+    'notes': ['notes', 'memo'],
+}
+
+CENT = Decimal('0.01')
+DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y', '%Y/%m/%d', '%d-%b-%Y']
+
+_OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<\r\n]*)')
+
+
+class ImportResult:
+    """Counts and per-row errors for one import."""
+
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        self.new_retailers = 0
+        self.error_count = 0
+        self.errors = []  # (line number, message)
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+
+class SkipRow(Exception):
+    """A well-formed row that is deliberately not imported, e.g. an OFX credit."""
+
+
+# ---------------------------------------------------------------------------
+# Parsers: yield (line number, {field: text}) per transaction
+# ---------------------------------------------------------------------------
+
+def parse_csv(stream, charge_sign=1):
+    """Read a CSV with a header row; charge_sign is the sign of a charge in its amount column.
+
+    When the file has a credit column, the amount column holds the debits,
+    so its values are charges whatever their sign.
+    """
+    reader = csv.reader(stream)
+    header = next(reader, None)
+    if header is None:
+        raise ValueError('The file is empty.')
+    names = [h.strip().lower() for h in header]
+    columns = {}
+    for field, candidates in CSV_HEADERS.items():
+        for candidate in candidates:
+            if candidate in names:
+                columns[field] = names.index(candidate)
+                break
+    if 'date' not in columns or 'amount' not in columns:
+        raise ValueError('The CSV needs a date column and a price or amount column.')
+    if 'item' not in columns and 'retailer' not in columns:
+        raise ValueError('The CSV needs an item, description or payee column.')
+
+    if 'credit' in columns:
+        charge_sign = None
+    for values in reader:
+        if not any(v.strip() for v in values):
+            continue
+        fields = {field: values[index].strip() if index < len(values) else ''
+                  for field, index in columns.items()}
+        fields['charge_sign'] = charge_sign
+        yield reader.line_num, fields
+
+
+def parse_ofx(stream):
+    """Read <STMTTRN> blocks from an OFX file, SGML (1.x) or XML (2.x)."""
+    current = None
+    for line_no, line in enumerate(stream, start=1):
+        for closing, tag, value in _OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if closing:
+                    if current is not None:
+                        yield current.pop('line'), current
+                    current = None
+                else:
+                    current = {'line': line_no}
+            elif current is not None and not closing and value.strip():
+                current[tag] = value.strip()
+
+
+def _ofx_fields(txn):
+    name, memo = txn.get('NAME', ''), txn.get('MEMO', '')
+    return {
+        'date': txn.get('DTPOSTED', '')[:8],
+        'amount': txn.get('TRNAMT', ''),
+        'item': name or memo,
+        'retailer': name,
+        'notes': memo if name else '',
+        'charge_sign': -1,
+    }
+
+
+def _parse_date(text, formats):
+    """Parse text with the first of formats that fits, moving it to the front.
+
+    Statements use one date format throughout, so after the first row every
+    date is parsed on the first try.
+    """
+    if re.fullmatch(r'\d{8}', text):
+        return date(int(text[:4]), int(text[4:6]), int(text[6:]))
+    for fmt in formats:
+        try:
+            parsed = datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+        if fmt != formats[0]:
+            formats.remove(fmt)
+            formats.insert(0, fmt)
+        return parsed
+    raise ValueError(f'unrecognised date {text!r}')
+
+
+def _parse_amount(text):
+    cleaned = text.replace('$', '').replace(',', '').strip()
+    negative = cleaned.startswith('(') and cleaned.endswith(')')
+    try:
+        amount = Decimal(cleaned.strip('()'))
+    except InvalidOperation:
+        raise ValueError(f'unrecognised amount {text!r}') from None
+    if not amount.is_finite():
+        raise ValueError(f'unrecognised amount {text!r}')
+    return -amount if negative else amount
+
+
+# ---------------------------------------------------------------------------
+# Import
+# ---------------------------------------------------------------------------
+
+class _Importer:
+    def __init__(self, project_id, default_category, create_retailers):
+        self.project_id = project_id
+        self.default_category = default_category
+        self.create_retailers = create_retailers
+        self.categories = {c.lower(): c for c in HOUSE_EXPENSE_CATEGORIES}
+        self.date_formats = list(DATE_FORMATS)
+        self.retailers = {}  # normalized name -> retailer id, or None if unmatched
+        self.result = ImportResult()
+
+    def build_row(self, fields):
+        """Turn parsed text fields into house_expenses column values."""
+        if not fields['amount'] and fields.get('credit'):
+            raise SkipRow()
+        amount = _parse_amount(fields['amount'])
+        # No sign: the amount comes from a debit column
+        sign = fields.get('charge_sign')
+        price = abs(amount) if sign is None else amount * sign
+        if price <= 0:
+            raise SkipRow()
+        tax = _parse_amount(fields['tax']) if fields.get('tax') else None
+        if tax is not None and tax < 0:
+            raise ValueError('tax cannot be negative')
+        price = price.quantize(CENT)
+        tax = tax.quantize(CENT) if tax is not None else None
+
+        retailer_name = fields.get('retailer', '')[:150]
+        item = (fields.get('item') or retailer_name)[:200]
+        if not item:
+            raise ValueError('no item or description')
+        category = self.categories.get(fields.get('category', '').lower(), self.default_category)
+        effective_tax, total_with_tax = expense_amounts(price, tax)
+        return {
+            'expenditure_date': _parse_date(fields['date'], self.date_formats),
+            'price': price,
+            'tax': tax,
+            'effective_tax': effective_tax,
+            'total_with_tax': total_with_tax,
+            'item': item,
+            'description': fields.get('notes') or None,
+            'category': category,
+            'project_id': self.project_id,
+            'retailer_id': self.retailer_id(retailer_name),
+            'is_active': True,
+        }
+
+    def retailer_id(self, name):
+        key = normalize_retailer_name(name)
+        if not key:
+            return None
+        if key not in self.retailers:
+            retailer_id = resolve_retailer(name)
+            if retailer_id is None and self.create_retailers:
+                retailer = Retailer(name=name)
+                db.session.add(retailer)
+                db.session.flush()
+                retailer_id = retailer.id
+                self.result.new_retailers += 1
+            self.retailers[key] = retailer_id
+        return self.retailers[key]
+
+    def flush(self, rows):
+        """Insert one batch with its rollup deltas and search documents, and commit it."""
+        if not rows:
+            return
+        table = HouseExpense.__table__
+        ids = db.session.scalars(table.insert().returning(table.c.id), rows).all()
+        search.index_expenses(ids)
+        deltas = {}
+        for row in rows:
+            rollups.add_snapshot(deltas, rollups.row_snapshot(row))
+        rollups.apply_deltas(deltas)
+        cache.bump_version(cache.DATA, cache.CHOICES)
+        db.session.commit()
+        self.result.imported += len(rows)
+
+    def run(self, transactions):
+        batch = []
+        for line, fields in transactions:
+            try:
+                batch.append(self.build_row(fields))
+            except SkipRow:
+                self.result.skipped += 1
+                continue
+            except (KeyError, ValueError) as exc:
+                self.result.add_error(line, str(exc))
+                continue
+            if len(batch) >= IMPORT_BATCH_SIZE:
+                self.flush(batch)
+                batch = []
+        self.flush(batch)
+        return self.result
+
+
+def import_expenses(file, project_id, default_category='Other', create_retailers=True, charge_sign=1):
+    """Import a CSV or OFX upload (a file-like object with a filename) into a project.
+
+    charge_sign is the sign of a charge in a CSV amount column: 1 when
+    charges are positive and payments negative, -1 the other way round.
+    Raises ValueError if the file as a whole can't be read, e.g. a CSV with no
+    date column; errors in individual rows are reported in the ImportResult.
+    """
+    filename = (getattr(file, 'filename', '') or '').lower()
+    raw = getattr(file, 'stream', file)
+    stream = io.TextIOWrapper(raw, encoding='utf-8-sig', errors='replace', newline='')
+    if filename.endswith(('.ofx', '.qfx')):
+        transactions = ((line, _ofx_fields(txn)) for line, txn in parse_ofx(stream))
+    else:
+        transactions = parse_csv(stream, charge_sign)
+    return _Importer(project_id, default_category, create_retailers).run(transactions)
@@ -0,0 +1,184 @@
+"""Prefix suggestions for expense item names.
+
+Each worker keeps a sorted index of the distinct item strings of active
+expenses, with how often each is used and the price, category and retailer
+of its most recent expense, so the expense form can prefill them.
+
+Gunicorn workers build the index on a background thread as they start
+(warm_in_background(), called from gunicorn.conf.py), so the first keystroke
+doesn't pay for reading the whole ledger; elsewhere it is built on first use.
+After that, whenever the 'data' cache version has moved, it re-reads the
+stats of just the items on expenses written since the last sync (found
+through the updated_at index). An edit that renames an item can't lower the
+old name's count that way, so once the last full build is REBUILD_SECONDS
+old the next change rebuilds it instead. Retailer renames move the
+'choices' version, which re-reads the retailer names.
+"""
+import bisect
+import heapq
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import func, select, true
+from app import cache, db
+from app.models import HouseExpense, Retailer
+
+# Full rebuild interval, which also drops counts left behind by renames
+REBUILD_SECONDS = 3600
+# Re-read rows written this long before the last sync, to cover transactions
+# that committed after it with an earlier updated_at
+SYNC_OVERLAP = timedelta(minutes=5)
+# Items whose stats are re-read per statement during a sync
+SYNC_BATCH_SIZE = 500
+# Most suggestions one search returns
+MAX_SUGGESTIONS = 20
+# Results for prefixes up to this long are cached, since they match the most items
+SHORT_PREFIX = 2
+
+Suggestion = namedtuple('Suggestion', 'item count price category retailer_id retailer')
+
+
+def _stats_query(items=None):
+    """SELECT one Suggestion row per item: its count and its latest expense."""
+    recent = func.row_number().over(
+        partition_by=HouseExpense.item,
+        order_by=(HouseExpense.expenditure_date.desc(), HouseExpense.id.desc()),
+    )
+    ranked = (
+        select(
+            HouseExpense.item,
+            func.count().over(partition_by=HouseExpense.item).label('uses'),
+            HouseExpense.price, HouseExpense.category, HouseExpense.retailer_id,
+            recent.label('recent'),
+        )
+        .where(HouseExpense.is_active == true())
+    )
+    if items is not None:
+        ranked = ranked.where(HouseExpense.item.in_(items))
+    ranked = ranked.subquery()
+    return (
+        select(ranked.c.item, ranked.c.uses, ranked.c.price, ranked.c.category,
+               ranked.c.retailer_id, Retailer.name)
+        .outerjoin(Retailer, ranked.c.retailer_id == Retailer.id)
+        .where(ranked.c.recent == 1)
+    )
+
+
+class ItemIndex:
+    """Distinct item strings sorted case-insensitively, with their Suggestion."""
+
+    def __init__(self):
+        self.keys = []    # sorted (item.lower(), item)
+        self.stats = {}   # item -> Suggestion
+        self.short = {}   # short prefix -> its MAX_SUGGESTIONS best Suggestions
+        self.version = None
+        self.choices_version = None
+        self.synced_at = None
+        self.built_at = 0.0
+        self.lock = threading.Lock()
+
+    def build(self):
+        started = datetime.utcnow()
+        stats = {}
+        for row in db.session.execute(_stats_query()):
+            stats[row[0]] = Suggestion(*row)
+        self.stats = stats
+        self.keys = sorted((item.lower(), item) for item in stats)
+        self.short = {}
+        self.synced_at = started
+        self.built_at = time.monotonic()
+
+    def _set(self, item, suggestion):
+        key = (item.lower(), item)
+        for length in range(1, SHORT_PREFIX + 1):
+            self.short.pop(key[0][:length], None)
+        if suggestion is None:
+            if self.stats.pop(item, None) is not None:
+                self.keys.pop(bisect.bisect_left(self.keys, key))
+            return
+        if item not in self.stats:
+            bisect.insort(self.keys, key)
+        self.stats[item] = suggestion
+
+    def sync(self):
+        """Refresh the items on expenses written since the last sync."""
+        started = datetime.utcnow()
+        changed = db.session.scalars(
+            select(HouseExpense.item).distinct()
+            .where(HouseExpense.updated_at >= self.synced_at - SYNC_OVERLAP)
+        ).all()
+        for start in range(0, len(changed), SYNC_BATCH_SIZE):
+            batch = changed[start:start + SYNC_BATCH_SIZE]
+            fresh = {row[0]: Suggestion(*row) for row in db.session.execute(_stats_query(batch))}
+            for item in batch:
+                self._set(item, fresh.get(item))
+        self.synced_at = started
+
+    def rename_retailers(self):
+        """Re-read the retailer names of every suggestion."""
+        names = dict(db.session.execute(select(Retailer.id, Retailer.name)).all())
+        self.stats = {
+            item: s._replace(retailer=names.get(s.retailer_id)) if s.retailer_id is not None else s
+            for item, s in self.stats.items()
+        }
+        self.short = {}
+
+    def refresh(self):
+        """Bring the index up to date with the 'data' and 'choices' cache versions."""
+        version = cache.get_version(cache.DATA)
+        choices_version = cache.get_version(cache.CHOICES)
+        if version == self.version and choices_version == self.choices_version and self.synced_at is not None:
+            return
+        with self.lock:
+            if self.synced_at is None or time.monotonic() - self.built_at > REBUILD_SECONDS:
+                self.build()
+            else:
+                if version != self.version:
+                    self.sync()
+                if choices_version != self.choices_version:
+                    self.rename_retailers()
+            self.version = version
+            self.choices_version = choices_version
+
+    def _search(self, prefix, limit):
+        lo = bisect.bisect_left(self.keys, (prefix,))
+        hi = bisect.bisect_left(self.keys, (prefix + '\uffff',), lo)
+        keys, stats = self.keys, self.stats
+        top = heapq.nlargest(limit, range(lo, hi), key=lambda i: stats[keys[i][1]].count)
+        return [stats[keys[i][1]] for i in top]
+
+    def search(self, prefix, limit=8):
+        """The limit most used items starting with prefix, ignoring case."""
+        prefix = prefix.lower()
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+        if len(prefix) > SHORT_PREFIX:
+            return self._search(prefix, limit)
+        if prefix not in self.short:
+            self.short[prefix] = self._search(prefix, MAX_SUGGESTIONS)
+        return self.short[prefix][:limit]
+
+
+_index = ItemIndex()
+
+
+def suggest_items(prefix, limit=8):
+    """Return up to limit Suggestions for items starting with prefix, most used first."""
+    prefix = prefix.strip()
+    if not prefix:
+        return []
+    _index.refresh()
+    with _index.lock:
+        return _index.search(prefix, limit)
+
+
+def warm_in_background(app):
+    """Build this process's index on a background thread."""
+    def run():
+        try:
+            with app.app_context():
+                _index.refresh()
+        except Exception:
+            app.logger.exception('Building the item suggestion index failed')
+
+    threading.Thread(target=run, name='warm-items', daemon=True).start()
@@ -0,0 +1,137 @@
+"""Prometheus metrics, served in text format from /metrics.
+
+Gunicorn runs several worker processes, and a scrape reaches only one of
+them. With PROMETHEUS_MULTIPROC_DIR set (see gunicorn.conf.py and the
+Dockerfile), every worker writes its samples to files in that directory and
+/metrics merges all of them, so the counts cover the whole server. Without
+it, as under `flask run`, the metrics are those of the one process.
+
+Collected:
+- request latency histograms labelled by blueprint and endpoint, and
+  request counts by status
+- requests in flight
+- time the session waits for a pooled connection at the start of a transaction
+- hits and misses of the per-process caches (app/cache.py)
+- row counts per table, read when /metrics is scraped
+"""
+import os
+import time
+from flask import Response, g, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest,
+)
+from prometheus_client.core import GaugeMetricFamily
+from sqlalchemy import event, func, literal, select, text, union_all
+from app import db
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request.',
+    ['blueprint', 'endpoint', 'method'],
+)
+REQUESTS = Counter(
+    'http_requests_total', 'Requests handled, by response status.',
+    ['blueprint', 'endpoint', 'method', 'status'],
+)
+IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests being handled right now.', multiprocess_mode='livesum',
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    'db_pool_checkout_seconds', 'Time from a session transaction starting to its connection being ready.',
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30),
+)
+CACHE_LOOKUPS = Counter(
+    'app_cache_lookups_total', 'Lookups in the per-process caches, by result (hit or miss).',
+    ['cache', 'result'],
+)
+
+
+def cache_lookup(name, hit):
+    CACHE_LOOKUPS.labels(name, 'hit' if hit else 'miss').inc()
+
+
+# ---------------------------------------------------------------------------
+# Table row counts, collected at scrape time
+# ---------------------------------------------------------------------------
+
+class TableRowsCollector:
+    """Rows per table: an exact count on SQLite, the planner's live-row estimate on Postgres."""
+
+    def collect(self):
+        family = GaugeMetricFamily('db_table_rows', 'Rows in each application table.', labels=['table'])
+        for table, rows in table_row_counts():
+            family.add_metric([table], rows)
+        yield family
+
+
+def table_row_counts():
+    if db.engine.dialect.name == 'postgresql':
+        # count(*) would read the whole expense ledger on every scrape
+        return db.session.execute(
+            text('SELECT relname, n_live_tup FROM pg_stat_user_tables ORDER BY relname')
+        ).all()
+    counts = union_all(*[
+        select(literal(table.name), func.count()).select_from(table)
+        for table in db.metadata.sorted_tables
+    ])
+    return db.session.execute(counts).all()
+
+
+def render():
+    """The text exposition of every metric, merged across workers when multiprocess."""
+    registry = CollectorRegistry()
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry.register(REGISTRY)
+    registry.register(TableRowsCollector())
+    return generate_latest(registry)
+
+
+# ---------------------------------------------------------------------------
+# Hooks
+# ---------------------------------------------------------------------------
+
+def _start_request():
+    g.metrics_started = time.perf_counter()
+    IN_FLIGHT.inc()
+
+
+def _count_response(response):
+    REQUESTS.labels(request.blueprint or '', request.endpoint or 'unmatched', request.method,
+                    response.status_code).inc()
+    return response
+
+
+def _finish_request(exc):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    IN_FLIGHT.dec()
+    REQUEST_LATENCY.labels(request.blueprint or '', request.endpoint or 'unmatched', request.method) \
+        .observe(time.perf_counter() - started)
+
+
+def _transaction_created(session, transaction):
+    if transaction.parent is None:
+        session.info['metrics_checkout_started'] = time.perf_counter()
+
+
+def _transaction_began(session, transaction, connection):
+    started = session.info.pop('metrics_checkout_started', None)
+    if started is not None:
+        POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+
+def init_app(app):
+    """Record request and session metrics and serve them from /metrics."""
+    app.before_request(_start_request)
+    app.after_request(_count_response)
+    app.teardown_request(_finish_request)
+    if not event.contains(db.session, 'after_begin', _transaction_began):
+        event.listen(db.session, 'after_transaction_create', _transaction_created)
+        event.listen(db.session, 'after_begin', _transaction_began)
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,201 @@
+"""Schema migrations for existing databases.
+
+db.create_all() only creates tables that are missing; it never touches a table
+that already exists. Changes to existing tables (indexes, columns, backfills)
+are registered here as numbered steps and applied in order by `flask upgrade-db`.
+Every step must be idempotent: a fresh database created by create_all() already
+has the current schema, and the steps then run as no-ops.
+"""
+from datetime import datetime
+from sqlalchemy import bindparam, func, inspect, or_, select, text
+from sqlalchemy.schema import CreateIndex
+from app import db, rollups, search
+from app.ranks import rank_sequence
+from app.models import (
+    SchemaMigration, ExpenseRollup, HouseExpense, HouseProject, HouseTodo, Retailer, SEARCH_INDEX_DDL, expense_amounts,
+    normalize_retailer_name,
+)
+
+MIGRATIONS = []
+
+# Rows read and rewritten per statement when a step backfills a column
+BACKFILL_BATCH_SIZE = 1000
+
+
+def migration(version, name):
+    """Register a migration step. Steps receive a Connection inside a transaction."""
+    def register(fn):
+        MIGRATIONS.append((version, name, fn))
+        return fn
+    return register
+
+
+def create_missing_indexes(conn, *models):
+    """Create the models' declared indexes that the database lacks.
+
+    Indexes on columns a later step adds are skipped; that step creates them.
+    """
+    inspector = inspect(conn)
+    for model in models:
+        table = model.__table__
+        existing = {c['name'] for c in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            if all(column.name in existing for column in index.columns):
+                index.create(conn, checkfirst=True)
+
+
+def add_missing_columns(conn, model, *names):
+    """ALTER TABLE ... ADD COLUMN for model columns the existing table lacks.
+
+    Columns are added without constraints or defaults, so the calling step
+    must backfill them.
+    """
+    table = model.__table__
+    existing = {c['name'] for c in inspect(conn).get_columns(table.name)}
+    preparer = conn.dialect.identifier_preparer
+    for name in names:
+        if name in existing:
+            continue
+        column = table.columns[name]
+        col_type = column.type.compile(dialect=conn.dialect)
+        conn.exec_driver_sql(
+            f'ALTER TABLE {preparer.format_table(table)} '
+            f'ADD COLUMN {preparer.format_column(column)} {col_type}'
+        )
+
+
+# ---------------------------------------------------------------------------
+# Steps
+# ---------------------------------------------------------------------------
+
+@migration(1, 'Indexes for the hot query columns')
+def _hot_query_indexes(conn):
+    create_missing_indexes(conn, HouseExpense, HouseProject, Retailer, HouseTodo)
+
+
+@migration(2, 'Persist effective_tax and total_with_tax on house_expenses')
+def _persist_expense_amounts(conn):
+    add_missing_columns(conn, HouseExpense, 'effective_tax', 'total_with_tax')
+    table = HouseExpense.__table__
+    pending = (
+        select(table.c.id, table.c.price, table.c.tax)
+        .where(or_(table.c.effective_tax.is_(None), table.c.total_with_tax.is_(None)))
+        .order_by(table.c.id)
+        .limit(BACKFILL_BATCH_SIZE)
+    )
+    update = (
+        table.update()
+        .where(table.c.id == bindparam('row_id'))
+        .values(effective_tax=bindparam('tax_amount'), total_with_tax=bindparam('total_amount'))
+    )
+    while True:
+        rows = conn.execute(pending).all()
+        if not rows:
+            break
+        params = []
+        for row in rows:
+            tax_amount, total_amount = expense_amounts(row.price, row.tax)
+            params.append({'row_id': row.id, 'tax_amount': tax_amount, 'total_amount': total_amount})
+        conn.execute(update, params)
+
+
+@migration(3, 'Populate expense_rollups')
+def _populate_expense_rollups(conn):
+    rollups.rebuild(conn)
+
+
+@migration(4, 'Lexicographic rank ordering for house_todos')
+def _todo_ranks(conn):
+    add_missing_columns(conn, HouseTodo, 'rank')
+    table = HouseTodo.__table__
+    ids = conn.execute(
+        select(table.c.id).where(table.c.rank.is_(None)).order_by(table.c.sort_order, table.c.id)
+    ).scalars().all()
+    if ids:
+        conn.execute(
+            table.update().where(table.c.id == bindparam('row_id')).values(rank=bindparam('new_rank')),
+            [{'row_id': todo_id, 'new_rank': rank} for todo_id, rank in zip(ids, rank_sequence(len(ids)))],
+        )
+    conn.execute(text('DROP INDEX IF EXISTS ix_house_todos_active_completed_order'))
+    create_missing_indexes(conn, HouseTodo)
+
+
+@migration(5, 'updated_at on retailers and indexes for conditional GETs')
+def _updated_at_indexes(conn):
+    add_missing_columns(conn, Retailer, 'updated_at')
+    table = Retailer.__table__
+    conn.execute(
+        table.update().where(table.c.updated_at.is_(None))
+        .values(updated_at=func.coalesce(table.c.created_at, datetime.utcnow()))
+    )
+    create_missing_indexes(conn, HouseExpense, HouseProject, Retailer, HouseTodo)
+
+
+@migration(6, 'Normalized retailer names with a trigram index')
+def _retailer_normalized_names(conn):
+    add_missing_columns(conn, Retailer, 'normalized_name')
+    table = Retailer.__table__
+    rows = conn.execute(select(table.c.id, table.c.name).where(table.c.normalized_name.is_(None))).all()
+    if rows:
+        # Keep the updated_at step 5 backfilled; a derived column isn't an edit
+        conn.execute(
+            table.update().where(table.c.id == bindparam('row_id'))
+            .values(normalized_name=bindparam('key'), updated_at=table.c.updated_at),
+            [{'row_id': row.id, 'key': normalize_retailer_name(row.name)} for row in rows],
+        )
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+    create_missing_indexes(conn, Retailer)
+
+
+@migration(7, 'Index on house_expenses.item for item suggestions')
+def _expense_item_index(conn):
+    create_missing_indexes(conn, HouseExpense)
+
+
+@migration(8, 'Full-text search documents for expenses, projects and to-dos')
+def _search_documents(conn):
+    # create_all() made search_documents; the full-text index may predate it
+    for statement in SEARCH_INDEX_DDL.get(conn.dialect.name, []):
+        conn.execute(text(statement))
+    search.rebuild(conn)
+
+
+@migration(9, 'Unique key for expense_rollups')
+def _unique_rollup_key(conn):
+    # Rebuilding merges any duplicate rows left by concurrent inserts
+    rollups.rebuild(conn)
+    conn.execute(text('DROP INDEX IF EXISTS ix_expense_rollups_key'))
+    # Reflection skips expression indexes, so checkfirst can't see this one
+    for index in ExpenseRollup.__table__.indexes:
+        conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+
+def applied_versions():
+    return set(db.session.execute(db.select(SchemaMigration.version)).scalars())
+
+
+def upgrade():
+    """Create missing tables and apply pending migrations, one transaction each.
+
+    Returns the (version, name) of every step applied.
+    """
+    db.create_all()
+    done = applied_versions()
+    db.session.commit()
+
+    applied = []
+    for version, name, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in done:
+            continue
+        with db.engine.begin() as conn:
+            fn(conn)
+            conn.execute(SchemaMigration.__table__.insert().values(
+                version=version, name=name, applied_at=datetime.utcnow(),
+            ))
+        applied.append((version, name))
+    return applied
@@ -1,10 +1,23 @@
+import re
 from app import db
 from flask_login import UserMixin
 from datetime import datetime, date
 from decimal import Decimal
+from sqlalchemy import DDL, Integer, cast, event, func, select, text, true, type_coerce
+from sqlalchemy.orm import validates
+from sqlalchemy.types import TypeDecorator
 from werkzeug.security import generate_password_hash, check_password_hash
 
 
+# Partial-index predicate for rows that haven't been soft-deleted. SQLite only
+# uses a partial index when the query repeats the predicate literally, so
+# queries that should hit these indexes compare is_active against true().
+ACTIVE_ONLY = {
+    'sqlite_where': text('is_active = 1'),
+    'postgresql_where': text('is_active'),
+}
+
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
 
@@ -24,27 +37,92 @@ class User(UserMixin, db.Model):
         return f'<User {self.username}>'
 
 
+class CacheVersion(db.Model):
+    """Version counters that invalidate the per-process caches in app/cache.py."""
+    __tablename__ = 'cache_versions'
+
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+class SchemaMigration(db.Model):
+    """Records which numbered steps in app/migrations.py have been applied."""
+    __tablename__ = 'schema_migrations'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 # ---------------------------------------------------------------------------
 # House Expense Tracker
 # ---------------------------------------------------------------------------
 
+def normalize_retailer_name(name):
+    """Reduce a retailer name to the key used for matching.
+
+    "HOME DEPOT #1234", "The Home Depot" and "homedepot.com" all become
+    "homedepot": lower case, no leading "the", no web address parts, no store
+    numbers and nothing but letters and digits.
+    """
+    name = (name or '').lower().strip()
+    key = re.sub(r'^(https?://)?(www\.)?', '', name)
+    key = re.sub(r'\.(com|net|org|co|us|biz)\b.*$', '', key)
+    key = re.sub(r'^the\s+', '', key)
+    key = re.sub(r'(#|no\.|store)\s*\d+', ' ', key)
+    key = re.sub(r'\s\d{3,}\b', ' ', key)
+    # A name that is nothing but a store number keeps it
+    return re.sub(r'[^a-z0-9]+', '', key) or re.sub(r'[^a-z0-9]+', '', name)
+
+
 class Retailer(db.Model):
     __tablename__ = 'retailers'
+    __table_args__ = (
+        db.Index('ix_retailers_active_name', 'is_active', 'name'),
+        db.Index('ix_retailers_updated_at', 'updated_at'),
+        # A trigram GIN index on Postgres (see app/retailers.py); a plain index elsewhere
+        db.Index(
+            'ix_retailers_normalized_name', 'normalized_name',
+            postgresql_using='gin', postgresql_ops={'normalized_name': 'gin_trgm_ops'},
+        ),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
+    # normalize_retailer_name(name), maintained by _sync_normalized_name
+    normalized_name = db.Column(db.String(150), nullable=True)
     website = db.Column(db.String(255), nullable=True)
     is_active = db.Column(db.Boolean, nullable=False, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    expenses = db.relationship('HouseExpense', back_populates='retailer', lazy=True)
+
+    # expense_count is an SQL column property defined after HouseExpense;
+    # undefer_group('totals') loads it with the retailer rows.
 
-    expenses = db.relationship('HouseExpense', backref='retailer', lazy=True)
+    @validates('name')
+    def _sync_normalized_name(self, key, value):
+        self.normalized_name = normalize_retailer_name(value)
+        return value
 
     def __repr__(self):
         return f'<Retailer {self.name}>'
 
 
+# The trigram index needs the pg_trgm extension on Postgres
+event.listen(
+    Retailer.__table__, 'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'),
+)
+
+
 class HouseProject(db.Model):
     __tablename__ = 'house_projects'
+    __table_args__ = (
+        db.Index('ix_house_projects_active_name', 'is_active', 'name'),
+        db.Index('ix_house_projects_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(150), nullable=False)
@@ -60,15 +138,10 @@ class HouseProject(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    expenses = db.relationship('HouseExpense', backref='project', lazy=True)
-
-    @property
-    def total_spent(self):
-        return sum((e.price for e in self.expenses if e.is_active), Decimal('0'))
+    expenses = db.relationship('HouseExpense', back_populates='project', lazy=True)
 
-    @property
-    def total_with_tax(self):
-        return sum((e.total_with_tax for e in self.expenses if e.is_active), Decimal('0'))
+    # total_spent and total_with_tax are SQL column properties defined after
+    # HouseExpense; undefer_group('totals') loads them with the project rows.
 
     def __repr__(self):
         return f'<HouseProject {self.name}>'
@@ -79,6 +152,12 @@ TODO_PRIORITIES = ['High', 'Medium', 'Low']
 
 class HouseTodo(db.Model):
     __tablename__ = 'house_todos'
+    __table_args__ = (
+        db.Index('ix_house_todos_active_completed_rank', 'is_active', 'completed', 'rank'),
+        db.Index('ix_house_todos_rank', 'rank'),
+        db.Index('ix_house_todos_project_id', 'project_id'),
+        db.Index('ix_house_todos_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -87,7 +166,14 @@ class HouseTodo(db.Model):
     start_date = db.Column(db.Date, nullable=True)
     due_date = db.Column(db.Date, nullable=True)
     priority = db.Column(db.String(10), nullable=False, default='Medium')
+    # Superseded by rank; kept so existing databases still accept inserts
     sort_order = db.Column(db.Integer, nullable=False, default=0)
+    # Lexicographic position in the list (see app/ranks.py); 'C' collation on
+    # Postgres so ordering is by code point
+    rank = db.Column(
+        db.String(64).with_variant(db.String(64, collation='C'), 'postgresql'),
+        nullable=False,
+    )
     completed = db.Column(db.Boolean, nullable=False, default=False)
     completed_at = db.Column(db.DateTime, nullable=True)
     is_active = db.Column(db.Boolean, nullable=False, default=True)
@@ -113,8 +199,53 @@ HOUSE_EXPENSE_CATEGORIES = [
 TAX_RATE = Decimal('0.055')
 
 
+def expense_amounts(price, tax=None):
+    """Return (effective_tax, total_with_tax) for an expense's price and optional tax.
+
+    Bulk inserts that bypass the ORM must use this to fill the persisted columns.
+    """
+    price = Decimal(str(price))
+    if tax is None:
+        effective_tax = (price * TAX_RATE).quantize(Decimal('0.01'))
+    else:
+        effective_tax = Decimal(str(tax))
+    return effective_tax, price + effective_tax
+
+
+class Cents(TypeDecorator):
+    """Integer cents in SQL, Decimal dollars in Python.
+
+    Money is summed in cents so that SQLite (which stores Numeric columns as
+    floating point) and Postgres produce identical totals.
+    """
+    impl = Integer
+    cache_ok = True
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return Decimal(int(value)).scaleb(-2)
+
+
+def cents(column):
+    return cast(func.round(column * 100), Integer)
+
+
+def sum_cents(expr):
+    """SUM() of a cents expression, returned as Decimal dollars (0 when empty)."""
+    return type_coerce(func.coalesce(func.sum(expr), 0), Cents)
+
+
 class HouseExpense(db.Model):
     __tablename__ = 'house_expenses'
+    __table_args__ = (
+        db.Index('ix_house_expenses_active_date', 'is_active', 'expenditure_date'),
+        db.Index('ix_house_expenses_project_date', 'project_id', 'expenditure_date', **ACTIVE_ONLY),
+        db.Index('ix_house_expenses_category_date', 'category', 'expenditure_date', **ACTIVE_ONLY),
+        db.Index('ix_house_expenses_retailer_id', 'retailer_id'),
+        db.Index('ix_house_expenses_updated_at', 'updated_at'),
+        db.Index('ix_house_expenses_item', 'item'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     expenditure_date = db.Column(db.Date, nullable=False)
@@ -127,20 +258,133 @@ class HouseExpense(db.Model):
     category = db.Column(db.String(50), nullable=False, default='Materials')
     retailer_id = db.Column(db.Integer, db.ForeignKey('retailers.id'), nullable=True)
     project_id = db.Column(db.Integer, db.ForeignKey('house_projects.id'), nullable=False)
+    # Stored tax if set, otherwise price at 5.5%; maintained from price and tax
+    effective_tax = db.Column(db.Numeric(12, 2), nullable=False)
+    total_with_tax = db.Column(db.Numeric(12, 2), nullable=False)
     is_active = db.Column(db.Boolean, nullable=False, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    @property
-    def effective_tax(self):
-        """Return stored tax if set, otherwise calculate at 5.5%."""
-        if self.tax is not None:
-            return self.tax
-        return (self.price * TAX_RATE).quantize(Decimal('0.01'))
+    project = db.relationship('HouseProject', back_populates='expenses')
+    retailer = db.relationship('Retailer', back_populates='expenses')
 
-    @property
-    def total_with_tax(self):
-        return self.price + self.effective_tax
+    @validates('price', 'tax')
+    def _sync_amounts(self, key, value):
+        """Keep the persisted effective_tax and total_with_tax in step with price and tax."""
+        price = value if key == 'price' else self.price
+        tax = value if key == 'tax' else self.tax
+        if price is not None:
+            self.effective_tax, self.total_with_tax = expense_amounts(price, tax)
+        return value
 
     def __repr__(self):
         return f'<HouseExpense {self.item} ${self.price}>'
+
+
+class ExpenseRollup(db.Model):
+    """Active expense sums per (year, month, project, category, retailer).
+
+    Maintained incrementally by app.rollups, which upserts against the unique
+    key so that concurrent writers adding the same new key share one row.
+    The key treats a NULL retailer as 0, since NULLs never conflict in a
+    unique index.
+    """
+    __tablename__ = 'expense_rollups'
+    __table_args__ = (
+        db.Index(
+            'uq_expense_rollups_key', 'year', 'month', 'project_id', 'category',
+            text('coalesce(retailer_id, 0)'), unique=True,
+        ),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    project_id = db.Column(db.Integer, db.ForeignKey('house_projects.id'), nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    retailer_id = db.Column(db.Integer, db.ForeignKey('retailers.id'), nullable=True)
+    price_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    tax_cents = db.Column(db.BigInteger, nullable=False, default=0)
+    expense_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ExpenseRollup {self.year}-{self.month:02d} {self.category}>'
+
+
+class SearchDocument(db.Model):
+    """One searchable row per active expense, project and to-do (see app/search.py).
+
+    The full-text index over title and body is created alongside the table:
+    an FTS5 table kept in step by triggers on SQLite, a GIN index on
+    SEARCH_TSVECTOR on Postgres.
+    """
+    __tablename__ = 'search_documents'
+    __table_args__ = (
+        db.Index('ix_search_documents_ref', 'kind', 'ref_id', unique=True),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # expense, project, todo
+    ref_id = db.Column(db.Integer, nullable=False)
+    title = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=True)
+
+
+SEARCH_TSVECTOR = "to_tsvector('english', title || ' ' || coalesce(body, ''))"
+
+# Full-text index DDL per dialect, run after search_documents is created and
+# by the migration that adds it to existing databases
+SEARCH_INDEX_DDL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5("
+        "title, body, content='search_documents', content_rowid='id', tokenize='porter unicode61')",
+        "CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN "
+        "INSERT INTO search_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+        "CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN "
+        "INSERT INTO search_fts(search_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END",
+        "CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN "
+        "INSERT INTO search_fts(search_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+        "INSERT INTO search_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    ],
+    'postgresql': [
+        f'CREATE INDEX IF NOT EXISTS ix_search_documents_tsv ON search_documents USING gin (({SEARCH_TSVECTOR}))',
+    ],
+}
+for _dialect, _statements in SEARCH_INDEX_DDL.items():
+    for _statement in _statements:
+        event.listen(SearchDocument.__table__, 'after_create', DDL(_statement).execute_if(dialect=_dialect))
+
+
+def price_cents():
+    return cents(HouseExpense.price)
+
+
+def tax_cents():
+    return cents(HouseExpense.effective_tax)
+
+
+def total_cents():
+    return cents(HouseExpense.total_with_tax)
+
+
+def _project_expense_sum(expr):
+    return db.column_property(
+        select(sum_cents(expr))
+        .where(HouseExpense.project_id == HouseProject.id, HouseExpense.is_active == true())
+        .scalar_subquery(),
+        deferred=True,
+        group='totals',
+    )
+
+
+HouseProject.total_spent = _project_expense_sum(price_cents())
+HouseProject.total_with_tax = _project_expense_sum(total_cents())
+
+# Counts soft-deleted expenses too, as the retailers page always has
+Retailer.expense_count = db.column_property(
+    select(func.count(HouseExpense.id))
+    .where(HouseExpense.retailer_id == Retailer.id)
+    .scalar_subquery(),
+    deferred=True,
+    group='totals',
+)
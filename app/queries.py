@@ -0,0 +1,304 @@
+"""Query helpers for the house expense tally.
+
+Tally aggregates are read from the pre-aggregated expense_rollups table (see
+app.rollups) and summed as integer cents (see app.models.Cents).
+"""
+from datetime import MAXYEAR, MINYEAR, date, timedelta
+from sqlalchemy import and_, false, func, or_, select, text, true
+from app import db
+from app.models import ExpenseRollup, HouseExpense, HouseProject, Retailer, sum_cents
+
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+
+# ---------------------------------------------------------------------------
+# Filters
+# ---------------------------------------------------------------------------
+
+def tally_filters(args):
+    """Read the Tally filter parameters from a request's query string."""
+    return {
+        'project_id': args.get('project_id', type=int),
+        'year': args.get('year', type=int),
+        'month': args.get('month', type=int),
+        'quarter': args.get('quarter', type=int),
+        'category': args.get('category', type=str) or None,
+    }
+
+
+def expense_list_filters(args):
+    """Read the expense list's filter parameters from a request's query string."""
+    return {
+        'project_id': args.get('project_id', type=int),
+        'category': args.get('category', type=str) or None,
+        'retailer_id': args.get('retailer_id', type=int),
+        'start': args.get('start', type=date.fromisoformat),
+        'end': args.get('end', type=date.fromisoformat),
+    }
+
+
+def _filter_months(month=None, quarter=None):
+    """Return the sorted months selected by the month and quarter filters."""
+    months = set(range(1, 13))
+    if month:
+        months &= {month}
+    if quarter:
+        # Q1=1-3, Q2=4-6, Q3=7-9, Q4=10-12
+        start_month = (quarter - 1) * 3 + 1
+        months &= set(range(start_month, start_month + 3))
+    return sorted(months)
+
+
+def _month_runs(months):
+    """Group sorted months into contiguous (first, last) runs."""
+    runs = []
+    for m in months:
+        if runs and runs[-1][1] == m - 1:
+            runs[-1][1] = m
+        else:
+            runs.append([m, m])
+    return runs
+
+
+def _next_month(year, month):
+    return date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+
+
+def _expense_year_span():
+    """Return (first, last) year with active expenses, or None when there are none."""
+    first, last = db.session.query(
+        func.min(HouseExpense.expenditure_date),
+        func.max(HouseExpense.expenditure_date),
+    ).filter(HouseExpense.is_active == true()).one()
+    if first is None:
+        return None
+    return first.year, last.year
+
+
+def date_ranges(year=None, month=None, quarter=None):
+    """Translate year/month/quarter filters into half-open [start, end) date ranges.
+
+    Returns None when the filters don't restrict the date at all. A month or
+    quarter without a year is expanded into one range per year that has data.
+    A year whose ranges can't be expressed as dates matches nothing.
+    """
+    months = _filter_months(month, quarter)
+    if not year and len(months) == 12:
+        return None
+    if not months:
+        return []
+    if year:
+        years = [year]
+    else:
+        span = _expense_year_span()
+        if span is None:
+            return []
+        years = range(span[0], span[1] + 1)
+
+    ranges = []
+    # The range of the last month of a year ends on January 1st of the next one
+    for y in (y for y in years if MINYEAR <= y < MAXYEAR):
+        for first, last in _month_runs(months):
+            ranges.append((date(y, first, 1), _next_month(y, last)))
+    return ranges
+
+
+def expense_criteria(project_id=None, year=None, month=None, quarter=None, category=None,
+                     retailer_id=None, start=None, end=None):
+    """Translate expense filters into WHERE criteria on HouseExpense.
+
+    Date filters become range comparisons on expenditure_date so the
+    (is_active, expenditure_date) index can be used. start and end are
+    inclusive dates.
+    """
+    criteria = [HouseExpense.is_active == true()]
+    if project_id:
+        criteria.append(HouseExpense.project_id == project_id)
+    ranges = date_ranges(year, month, quarter)
+    if ranges is not None:
+        criteria.append(or_(false(), *(
+            and_(HouseExpense.expenditure_date >= range_start, HouseExpense.expenditure_date < range_end)
+            for range_start, range_end in ranges
+        )))
+    if start:
+        criteria.append(HouseExpense.expenditure_date >= start)
+    if end:
+        criteria.append(HouseExpense.expenditure_date < end + timedelta(days=1))
+    if category:
+        criteria.append(HouseExpense.category == category)
+    if retailer_id:
+        criteria.append(HouseExpense.retailer_id == retailer_id)
+    return criteria
+
+
+def explain(query):
+    """Return the database's query plan for a Query, one line per step."""
+    statement = query.statement.compile(db.engine, compile_kwargs={'literal_binds': True})
+    if db.engine.dialect.name == 'sqlite':
+        rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {statement}')).all()
+        return [row[-1] for row in rows]
+    return [row[0] for row in db.session.execute(text(f'EXPLAIN {statement}')).all()]
+
+
+def export_filters(args):
+    """Read CSV export filters: the Tally's and the expense list's together."""
+    return {**tally_filters(args), **expense_list_filters(args)}
+
+
+def export_statement(criteria):
+    """SELECT the CSV export columns, with project and retailer names joined in."""
+    return (
+        select(
+            HouseExpense.expenditure_date, HouseExpense.item, HouseExpense.description,
+            HouseExpense.category, HouseProject.name, Retailer.name,
+            HouseExpense.price, HouseExpense.tax, HouseExpense.effective_tax, HouseExpense.total_with_tax,
+        )
+        .join(HouseProject, HouseExpense.project_id == HouseProject.id)
+        .outerjoin(Retailer, HouseExpense.retailer_id == Retailer.id)
+        .where(*criteria)
+        .order_by(HouseExpense.expenditure_date, HouseExpense.id)
+    )
+
+
+# ---------------------------------------------------------------------------
+# Keyset pagination
+# ---------------------------------------------------------------------------
+
+def encode_cursor(expense):
+    return f'{expense.expenditure_date.isoformat()}.{expense.id}'
+
+
+def decode_cursor(cursor):
+    """Return (expenditure_date, id) from a cursor, or None if it is malformed."""
+    try:
+        day, expense_id = cursor.split('.')
+        day, expense_id = date.fromisoformat(day), int(expense_id)
+    except (AttributeError, ValueError):
+        return None
+    # Ids past a 64-bit integer can't be bound as a query parameter
+    if not 0 <= expense_id < 2 ** 63:
+        return None
+    return day, expense_id
+
+
+def keyset_page(query, cursor=None, newest_first=True, page_size=50):
+    """Return (expenses, next_cursor) for one page ordered by (expenditure_date, id).
+
+    The cursor is the last row of the previous page, so every page is an
+    index range scan no matter how deep it is. Raises ValueError for a
+    malformed cursor.
+    """
+    day, expense_id = HouseExpense.expenditure_date, HouseExpense.id
+    position = decode_cursor(cursor) if cursor else None
+    if cursor and position is None:
+        raise ValueError(f'malformed cursor {cursor!r}')
+    if newest_first:
+        if position:
+            query = query.filter(day <= position[0], or_(day < position[0], expense_id < position[1]))
+        query = query.order_by(day.desc(), expense_id.desc())
+    else:
+        if position:
+            query = query.filter(day >= position[0], or_(day > position[0], expense_id > position[1]))
+        query = query.order_by(day.asc(), expense_id.asc())
+
+    rows = query.limit(page_size + 1).all()
+    if len(rows) > page_size:
+        return rows[:page_size], encode_cursor(rows[page_size - 1])
+    return rows, None
+
+
+# ---------------------------------------------------------------------------
+# Aggregates (read from the expense_rollups table)
+# ---------------------------------------------------------------------------
+
+def rollup_criteria(project_id=None, year=None, month=None, quarter=None, category=None):
+    """Translate Tally filters into WHERE criteria on ExpenseRollup."""
+    criteria = []
+    if project_id:
+        criteria.append(ExpenseRollup.project_id == project_id)
+    if year:
+        criteria.append(ExpenseRollup.year == year)
+    months = _filter_months(month, quarter)
+    if len(months) < 12:
+        criteria.append(ExpenseRollup.month.in_(months))
+    if category:
+        criteria.append(ExpenseRollup.category == category)
+    return criteria
+
+
+def _rollup_total():
+    return sum_cents(ExpenseRollup.price_cents + ExpenseRollup.tax_cents).label('total')
+
+
+def expense_totals(criteria):
+    """Return (count, total_price, total_tax) for the matching expenses."""
+    row = db.session.query(
+        func.coalesce(func.sum(ExpenseRollup.expense_count), 0),
+        sum_cents(ExpenseRollup.price_cents),
+        sum_cents(ExpenseRollup.tax_cents),
+    ).filter(*criteria).one()
+    return int(row[0]), row[1], row[2]
+
+
+def totals_by_category(criteria):
+    """Return [(category, total_with_tax)] sorted by total, largest first."""
+    total = _rollup_total()
+    rows = (
+        db.session.query(ExpenseRollup.category, total)
+        .filter(*criteria)
+        .group_by(ExpenseRollup.category)
+        .having(func.sum(ExpenseRollup.expense_count) > 0)
+        .order_by(total.desc())
+        .all()
+    )
+    return [(category, amount) for category, amount in rows]
+
+
+def totals_by_project(criteria):
+    """Return [(project name, total_with_tax)] sorted by total, largest first."""
+    total = _rollup_total()
+    rows = (
+        db.session.query(HouseProject.name, total)
+        .join(HouseProject, ExpenseRollup.project_id == HouseProject.id)
+        .filter(*criteria)
+        .group_by(HouseProject.id, HouseProject.name)
+        .having(func.sum(ExpenseRollup.expense_count) > 0)
+        .order_by(total.desc())
+        .all()
+    )
+    return [(name, amount) for name, amount in rows]
+
+
+def totals_by_month(criteria):
+    """Return [((year, month), total_with_tax)] in chronological order."""
+    rows = (
+        db.session.query(ExpenseRollup.year, ExpenseRollup.month, _rollup_total())
+        .filter(*criteria)
+        .group_by(ExpenseRollup.year, ExpenseRollup.month)
+        .having(func.sum(ExpenseRollup.expense_count) > 0)
+        .order_by(ExpenseRollup.year, ExpenseRollup.month)
+        .all()
+    )
+    return [((y, m), amount) for y, m, amount in rows]
+
+
+def years_with_expenses(years=None):
+    """Return the years that have active expenses, newest first.
+
+    Answered from the rollup table, which holds at most a few hundred rows per
+    year. Pass years to only check those.
+    """
+    query = db.session.query(ExpenseRollup.year)
+    if years is not None:
+        query = query.filter(ExpenseRollup.year.in_(years))
+    rows = (
+        query.group_by(ExpenseRollup.year)
+        .having(func.sum(ExpenseRollup.expense_count) > 0)
+        .order_by(ExpenseRollup.year.desc())
+        .all()
+    )
+    return [year for year, in rows]
+
+
+def month_label(year, month):
+    return f"{MONTH_NAMES[month - 1]} {year}"
@@ -0,0 +1,130 @@
+"""Lexicographic rank keys for ordering to-dos.
+
+A rank is a string of base-36 digits that never ends in '0'. Ordering by rank
+is plain string ordering, and there is always room for a new key between any
+two keys, so moving one item only rewrites that item's rank. Keys grow longer
+as items are squeezed into the same gap; rebalance_todos() rewrites them all
+as short, evenly spaced keys once any key passes MAX_RANK_LENGTH.
+"""
+import threading
+from sqlalchemy import case, update
+from app import db
+from app.models import HouseTodo
+
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+
+# Keys longer than this trigger a background rebalance
+MAX_RANK_LENGTH = 16
+# Rows rewritten per UPDATE ... CASE statement while rebalancing
+REBALANCE_BATCH_SIZE = 1000
+
+
+def _midpoint(lower, upper):
+    """Return a key strictly between lower and upper ('' is the minimum, None the maximum)."""
+    if upper is not None:
+        # Skip the common prefix, treating a short lower key as padded with '0'
+        n = 0
+        while n < len(upper) and (lower[n] if n < len(lower) else '0') == upper[n]:
+            n += 1
+        if n > 0:
+            return upper[:n] + _midpoint(lower[n:], upper[n:])
+
+    low = DIGITS.index(lower[0]) if lower else 0
+    high = DIGITS.index(upper[0]) if upper is not None else BASE
+    if high - low > 1:
+        return DIGITS[(low + high) // 2]
+    # Adjacent digits: a one-digit prefix of upper fits if upper is longer
+    if upper is not None and len(upper) > 1:
+        return upper[:1]
+    return DIGITS[low] + _midpoint(lower[1:], None)
+
+
+def rank_between(lower=None, upper=None):
+    """Return a rank that sorts after lower and before upper (either may be None)."""
+    lower = lower or ''
+    if upper is not None and lower >= upper:
+        raise ValueError(f'rank {lower!r} is not below {upper!r}')
+    return _midpoint(lower, upper)
+
+
+def rank_after(key):
+    """Return a short rank above key, for appending after the current maximum.
+
+    Read as a base-36 fraction, a key with n leading 'z' digits is within
+    36**-n of the top of the key space. Appending steps up by one unit in
+    digit 2n, roughly the square of that remaining gap, so the gap shrinks
+    like 1/appends and keys grow by about two digits per factor of 36
+    appends: 1,000 appends end in 3-digit keys, a million in 7.
+    """
+    key = key or ''
+    position = 2 * (len(key) - len(key.lstrip(DIGITS[-1])))
+    digits = [DIGITS.index(c) for c in key[:position + 1].ljust(position + 1, '0')]
+    # Carry; it stops before the leading 'z's, since the digit after them isn't one
+    while digits[position] == BASE - 1:
+        digits[position] = 0
+        position -= 1
+    digits[position] += 1
+    return ''.join(DIGITS[d] for d in digits).rstrip('0')
+
+
+def _encode(value, width):
+    digits = []
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        digits.append(DIGITS[digit])
+    return ''.join(reversed(digits))
+
+
+def rank_sequence(count):
+    """Return count ascending, evenly spaced ranks in the lower half of the key space.
+
+    The upper half is left free so rank_after() keeps appended keys short.
+    """
+    width = 1
+    while BASE ** width < 2 * (count + 1) * BASE:
+        width += 1
+    step = BASE ** width // (2 * (count + 1))
+    return [_encode((i + 1) * step, width).rstrip('0') for i in range(count)]
+
+
+# ---------------------------------------------------------------------------
+# Rebalancing
+# ---------------------------------------------------------------------------
+
+def rebalance_todos():
+    """Rewrite every to-do's rank as a short key, preserving the current order."""
+    ids = db.session.scalars(
+        db.select(HouseTodo.id).order_by(HouseTodo.rank, HouseTodo.id).with_for_update()
+    ).all()
+    ranks = dict(zip(ids, rank_sequence(len(ids))))
+    for start in range(0, len(ids), REBALANCE_BATCH_SIZE):
+        chunk = ids[start:start + REBALANCE_BATCH_SIZE]
+        db.session.execute(
+            update(HouseTodo)
+            .where(HouseTodo.id.in_(chunk))
+            .values(rank=case({todo_id: ranks[todo_id] for todo_id in chunk}, value=HouseTodo.id))
+            .execution_options(synchronize_session=False)
+        )
+    db.session.commit()
+    return len(ids)
+
+
+_rebalance_lock = threading.Lock()
+
+
+def schedule_rebalance(app):
+    """Rebalance in a background thread, unless this process is already doing so."""
+    if not _rebalance_lock.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            with app.app_context():
+                rebalance_todos()
+        except Exception:
+            app.logger.exception('To-do rank rebalance failed')
+        finally:
+            _rebalance_lock.release()
+
+    threading.Thread(target=run, name='rebalance-todos', daemon=True).start()
@@ -0,0 +1,117 @@
+"""Fuzzy retailer matching on normalized names.
+
+Names are compared by their normalize_retailer_name() key using trigram
+similarity (shared trigrams over all trigrams, as in pg_trgm), with a bonus
+for keys that start with the query so type-ahead works from the first few
+letters. On Postgres the pg_trgm GIN index on retailers.normalized_name does
+the work; elsewhere each worker keeps an in-memory trigram index, rebuilt
+when the 'choices' cache version changes.
+"""
+from collections import defaultdict, namedtuple
+from sqlalchemy import case, func, literal, select, true
+from app import cache, db
+from app.models import Retailer, normalize_retailer_name
+
+# Matches scoring below this are not suggested
+MIN_SCORE = 0.2
+# An import row is filed under an existing retailer only above this score
+RESOLVE_SCORE = 0.7
+# Most matches one search returns
+MAX_MATCHES = 20
+
+Match = namedtuple('Match', 'id name score')
+
+
+def trigrams(key):
+    """The trigrams of a key, padded like pg_trgm so short prefixes still match."""
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _prefix_score(query, key):
+    return 0.5 + 0.5 * len(query) / len(key) if key.startswith(query) else 0.0
+
+
+class NgramIndex:
+    """An in-memory trigram index over (id, name, normalized name) entries."""
+
+    def __init__(self, entries):
+        self.entries = {}
+        self.postings = defaultdict(set)
+        for retailer_id, name, key in entries:
+            grams = trigrams(key)
+            self.entries[retailer_id] = (name, key, len(grams))
+            for gram in grams:
+                self.postings[gram].add(retailer_id)
+
+    def search(self, query, limit=5, min_score=MIN_SCORE, prefix=True):
+        grams = trigrams(query)
+        shared = defaultdict(int)
+        for gram in grams:
+            for retailer_id in self.postings.get(gram, ()):
+                shared[retailer_id] += 1
+        matches = []
+        for retailer_id, count in shared.items():
+            name, key, size = self.entries[retailer_id]
+            score = count / (len(grams) + size - count)
+            if prefix:
+                score = max(score, _prefix_score(query, key))
+            if score >= min_score:
+                matches.append(Match(retailer_id, name, round(score, 3)))
+        matches.sort(key=lambda m: (-m.score, m.name))
+        return matches[:limit]
+
+
+def _load_index():
+    return NgramIndex(db.session.execute(
+        select(Retailer.id, Retailer.name, Retailer.normalized_name)
+        .where(Retailer.is_active == true(), Retailer.normalized_name != '')
+    ).all())
+
+
+def retailer_index():
+    """This worker's NgramIndex of active retailers."""
+    return cache.cached('retailer_index', cache.CHOICES, _load_index)
+
+
+def _search_postgres(query, limit, min_score, prefix):
+    key = Retailer.normalized_name
+    score = func.similarity(key, query)
+    candidates = key.op('%')(literal(query))
+    if prefix:
+        score = func.greatest(score, case(
+            (key.startswith(query), 0.5 + 0.5 * len(query) / func.greatest(func.length(key), 1)),
+            else_=0.0,
+        ))
+        candidates = candidates | key.startswith(query)
+    score = score.label('score')
+    rows = db.session.execute(
+        select(Retailer.id, Retailer.name, score)
+        .where(Retailer.is_active == true())
+        # % and LIKE 'prefix%' can both use the trigram index
+        .where(candidates)
+        .order_by(score.desc(), Retailer.name)
+        .limit(limit)
+    ).all()
+    return [Match(r.id, r.name, round(float(r.score), 3)) for r in rows if r.score >= min_score]
+
+
+def match_retailers(name, limit=5, min_score=MIN_SCORE, prefix=True):
+    """Return up to limit active retailers whose names resemble name, best first.
+
+    With prefix, retailers whose key starts with the query score at least 0.5,
+    which is what a type-ahead wants; resolve_retailer() turns it off.
+    """
+    query = normalize_retailer_name(name)
+    if not query:
+        return []
+    limit = max(1, min(limit, MAX_MATCHES))
+    if db.engine.dialect.name == 'postgresql':
+        return _search_postgres(query, limit, min_score, prefix)
+    return retailer_index().search(query, limit, min_score, prefix)
+
+
+def resolve_retailer(name):
+    """Return the id of the retailer name most likely refers to, or None."""
+    matches = match_retailers(name, limit=1, min_score=RESOLVE_SCORE, prefix=False)
+    return matches[0].id if matches else None
@@ -0,0 +1,116 @@
+"""Incremental maintenance of the expense_rollups table.
+
+Routes that write expenses take a snapshot() of the expense before and after
+the change and pass both to record_change() before committing, so the rollup
+update lands in the same transaction as the expense itself.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from types import SimpleNamespace
+from sqlalchemy import Integer, cast, delete, extract, func, insert, literal_column, select, true
+from app import cache, db, queries
+from app.models import ExpenseRollup, HouseExpense, price_cents, tax_cents
+
+
+def _to_cents(amount):
+    return int((Decimal(amount) * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+
+def snapshot(expense):
+    """Return the rollup contribution of an expense, or None if it contributes nothing."""
+    # is_active is still None on a new expense until its column default is applied
+    if expense.is_active is False:
+        return None
+    key = (
+        expense.expenditure_date.year,
+        expense.expenditure_date.month,
+        expense.project_id,
+        expense.category,
+        expense.retailer_id or None,
+    )
+    return key, _to_cents(expense.price), _to_cents(expense.effective_tax), 1
+
+
+def row_snapshot(values):
+    """snapshot() for a dict of house_expenses column values, e.g. from a bulk insert."""
+    return snapshot(SimpleNamespace(**{'is_active': None, **values}))
+
+
+def add_snapshot(deltas, snap, sign=1):
+    """Add (sign=1) or remove (sign=-1) a snapshot's contribution in a deltas mapping."""
+    if snap is None:
+        return
+    key, price, tax, count = snap
+    total = deltas.get(key, (0, 0, 0))
+    deltas[key] = (total[0] + sign * price, total[1] + sign * tax, total[2] + sign * count)
+
+
+_KEY_COLUMNS = ('year', 'month', 'project_id', 'category', 'retailer_id')
+
+
+def _upsert_statement():
+    """INSERT of one key's deltas that adds them to the key's row if it exists, for executemany."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    table = ExpenseRollup.__table__
+    statement = dialect_insert(table)
+    # The conflict target must repeat the expressions of uq_expense_rollups_key
+    key = [*(table.c[name] for name in _KEY_COLUMNS[:-1]), func.coalesce(table.c.retailer_id, literal_column('0'))]
+    return statement.on_conflict_do_update(
+        index_elements=key,
+        set_={
+            'price_cents': table.c.price_cents + statement.excluded.price_cents,
+            'tax_cents': table.c.tax_cents + statement.excluded.tax_cents,
+            'expense_count': table.c.expense_count + statement.excluded.expense_count,
+        },
+    )
+
+
+def apply_deltas(deltas):
+    """Apply a {key: (price, tax, count)} mapping, e.g. one accumulated over a batch.
+
+    Every key is upserted by a single executemany, so a batch costs one
+    statement no matter how many keys it touches, and each delta lands on
+    exactly one row.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+    if not deltas:
+        return
+    # Only a change in count can add or empty a year in the Tally's year filter
+    years = {key[0] for key, (_, _, count) in deltas.items() if count}
+    years_before = queries.years_with_expenses(years) if years else []
+    db.session.execute(_upsert_statement(), [
+        dict(zip(_KEY_COLUMNS, key), price_cents=price, tax_cents=tax, expense_count=count)
+        for key, (price, tax, count) in deltas.items()
+    ])
+    cache.sync_expense_years(years, years_before)
+
+
+def record_change(before, after):
+    """Move an expense's contribution from its before snapshot to its after snapshot."""
+    deltas = {}
+    add_snapshot(deltas, before, -1)
+    add_snapshot(deltas, after, 1)
+    apply_deltas(deltas)
+
+
+def rebuild(bind=None):
+    """Recompute every rollup row from the expense table."""
+    bind = bind if bind is not None else db.session
+    year = cast(extract('year', HouseExpense.expenditure_date), Integer)
+    month = cast(extract('month', HouseExpense.expenditure_date), Integer)
+    grouped = (
+        select(
+            year, month, HouseExpense.project_id, HouseExpense.category, HouseExpense.retailer_id,
+            func.sum(price_cents()), func.sum(tax_cents()), func.count(HouseExpense.id),
+        )
+        .where(HouseExpense.is_active == true())
+        .group_by(year, month, HouseExpense.project_id, HouseExpense.category, HouseExpense.retailer_id)
+    )
+    bind.execute(delete(ExpenseRollup))
+    bind.execute(insert(ExpenseRollup).from_select(
+        ['year', 'month', 'project_id', 'category', 'retailer_id',
+         'price_cents', 'tax_cents', 'expense_count'],
+        grouped,
+    ))
@@ -1,15 +1,47 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, make_response
+from flask import (
+    Blueprint, Response, abort, render_template, redirect, url_for, request, flash, make_response, jsonify,
+    stream_with_context,
+)
 from flask_login import login_required
+import csv
+import io
 import json
 from app import db
 from app.models import HouseExpense, HouseProject, Retailer, HOUSE_EXPENSE_CATEGORIES
-from app.forms import HouseExpenseForm, HouseProjectForm, RetailerForm
+from app.forms import ExpenseImportForm, HouseExpenseForm, HouseProjectForm, RetailerForm
+from app import importer, items, rollups, search
+from app.retailers import match_retailers
+from app.conditional import conditional_response, data_validators, not_modified, page_validators
+from app.cache import (
+    CHOICES, DATA, LRUCache, bump_version, get_version, expense_years, project_choices, retailer_choices,
+)
+from app.queries import (
+    tally_filters, expense_list_filters, export_filters, export_statement, expense_criteria, keyset_page,
+    rollup_criteria, expense_totals, totals_by_category, totals_by_project, totals_by_month, month_label,
+)
 from datetime import date
-from decimal import Decimal
-from sqlalchemy import extract, func
+from sqlalchemy.orm import joinedload, undefer_group
 
 bp = Blueprint('house', __name__, url_prefix='/house')
 
+# Number of rows shown in the Tally page's expense list
+RECENT_EXPENSE_LIMIT = 100
+# Rows per page of the expense list
+EXPENSE_PAGE_SIZE = 50
+# Relationships every expense list template reads, loaded with the rows
+EXPENSE_LIST_LOADS = (joinedload(HouseExpense.project), joinedload(HouseExpense.retailer))
+# Rows fetched per round trip while streaming the CSV export
+EXPORT_BATCH_SIZE = 1000
+EXPORT_COLUMNS = [
+    'date', 'item', 'description', 'category', 'project', 'retailer',
+    'price', 'tax', 'effective_tax', 'total_with_tax',
+]
+# Tally API payloads kept per worker, keyed by data version and filters
+TALLY_CACHE_SIZE = 128
+
+tally_payloads = LRUCache(TALLY_CACHE_SIZE, name='tally_payloads')
+
+
 @bp.before_request
 @login_required
 def require_login():
@@ -21,11 +53,8 @@ def require_login():
 
 def _populate_expense_form_choices(form):
     """Populate the dynamic SelectField choices from the database."""
-    projects = HouseProject.query.filter_by(is_active=True).order_by(HouseProject.name).all()
-    form.project_id.choices = [(p.id, p.name) for p in projects]
-
-    retailers = Retailer.query.filter_by(is_active=True).order_by(Retailer.name).all()
-    form.retailer_id.choices = [(0, '— None —')] + [(r.id, r.name) for r in retailers]
+    form.project_id.choices = [(p.id, p.name) for p in project_choices()]
+    form.retailer_id.choices = [(0, '— None —')] + [(r.id, r.name) for r in retailer_choices()]
 
 
 # ---------------------------------------------------------------------------
@@ -34,98 +63,87 @@ def _populate_expense_form_choices(form):
 
 @bp.route('/')
 def index():
-    # --- filter params ---
-    project_id = request.args.get('project_id', type=int)
-    year = request.args.get('year', type=int)
-    month = request.args.get('month', type=int)
-    quarter = request.args.get('quarter', type=int)
-    category = request.args.get('category', type=str)
-
-    query = HouseExpense.query.filter_by(is_active=True)
-
-    if project_id:
-        query = query.filter(HouseExpense.project_id == project_id)
-    if year:
-        query = query.filter(extract('year', HouseExpense.expenditure_date) == year)
-    if month:
-        query = query.filter(extract('month', HouseExpense.expenditure_date) == month)
-    if quarter:
-        # Q1=1-3, Q2=4-6, Q3=7-9, Q4=10-12
-        start_month = (quarter - 1) * 3 + 1
-        end_month = start_month + 2
-        query = query.filter(
-            extract('month', HouseExpense.expenditure_date) >= start_month,
-            extract('month', HouseExpense.expenditure_date) <= end_month,
-        )
-    if category:
-        query = query.filter(HouseExpense.category == category)
-
-    expenses = query.order_by(HouseExpense.expenditure_date.desc()).all()
-
-    # --- totals ---
-    total_price = sum((e.price for e in expenses), Decimal('0'))
-    total_tax = sum((e.effective_tax for e in expenses), Decimal('0'))
-    total_with_tax = total_price + total_tax
-
-    # --- breakdown by category ---
-    by_category = {}
-    for e in expenses:
-        by_category.setdefault(e.category, Decimal('0'))
-        by_category[e.category] += e.total_with_tax
-    by_category = sorted(by_category.items(), key=lambda x: x[1], reverse=True)
-
-    # --- breakdown by project ---
-    by_project = {}
-    for e in expenses:
-        label = e.project.name
-        by_project.setdefault(label, Decimal('0'))
-        by_project[label] += e.total_with_tax
-    by_project = sorted(by_project.items(), key=lambda x: x[1], reverse=True)
-
-    # --- breakdown by month ---
-    MONTH_NAMES = ['Jan','Feb','Mar','Apr','May','Jun','Jul','Aug','Sep','Oct','Nov','Dec']
-    by_month = {}
-    for e in expenses:
-        key = (e.expenditure_date.year, e.expenditure_date.month)
-        by_month.setdefault(key, Decimal('0'))
-        by_month[key] += e.total_with_tax
-    by_month = sorted(by_month.items())
-    by_month_labels = [f"{MONTH_NAMES[k[1]-1]} {k[0]}" for k, _ in by_month]
-    by_month_values = [float(v) for _, v in by_month]
-
-    # --- filter options ---
-    all_projects = HouseProject.query.filter_by(is_active=True).order_by(HouseProject.name).all()
-    available_years = sorted(
-        {e.expenditure_date.year for e in HouseExpense.query.filter_by(is_active=True).all()},
-        reverse=True
-    )
-
+    """The Tally page shell; its figures are fetched from api_tally()."""
+    filters = tally_filters(request.args)
     return render_template(
         'house/index.html',
-        expenses=expenses,
-        total_price=total_price,
-        total_tax=total_tax,
-        total_with_tax=total_with_tax,
-        by_category=by_category,
-        by_project=by_project,
-        all_projects=all_projects,
-        available_years=available_years,
-        # chart data (JSON-safe)
-        chart_category_labels=[c for c, _ in by_category],
-        chart_category_values=[float(v) for _, v in by_category],
-        chart_project_labels=[p for p, _ in by_project],
-        chart_project_values=[float(v) for _, v in by_project],
-        chart_month_labels=by_month_labels,
-        chart_month_values=by_month_values,
-        # active filters
-        filter_project_id=project_id,
-        filter_year=year,
-        filter_month=month,
-        filter_quarter=quarter,
-        filter_category=category,
+        all_projects=project_choices(),
+        available_years=expense_years(),
         all_categories=HOUSE_EXPENSE_CATEGORIES,
+        recent_limit=RECENT_EXPENSE_LIMIT,
+        # active filters
+        filter_project_id=filters['project_id'],
+        filter_year=filters['year'],
+        filter_month=filters['month'],
+        filter_quarter=filters['quarter'],
+        filter_category=filters['category'],
+    )
+
+
+@bp.route('/api/tally')
+def api_tally():
+    """Totals, breakdowns and the most recent expenses for a set of Tally filters."""
+    filters = tally_filters(request.args)
+    version = get_version(DATA)
+    validators = data_validators(version, sorted(filters.items()))
+    unchanged = not_modified(validators)
+    if unchanged is not None:
+        return unchanged
+
+    cache_key = (version, tuple(sorted(filters.items())))
+    payload = tally_payloads.get(cache_key)
+    status = 'HIT'
+    if payload is None:
+        payload = _tally_payload(filters)
+        tally_payloads.put(cache_key, payload)
+        status = 'MISS'
+
+    response = conditional_response(jsonify(payload), validators)
+    response.headers['X-Cache'] = status
+    return response
+
+
+def _money(amount):
+    return f'{amount:.2f}'
+
+
+def _tally_payload(filters):
+    # --- totals and breakdowns (from the pre-aggregated rollups) ---
+    summary = rollup_criteria(**filters)
+    expense_count, total_price, total_tax = expense_totals(summary)
+
+    # --- only the rows the expense list actually shows ---
+    expenses = (
+        HouseExpense.query.filter(*expense_criteria(**filters))
+        .options(*EXPENSE_LIST_LOADS)
+        .order_by(HouseExpense.expenditure_date.desc(), HouseExpense.id.desc())
+        .limit(RECENT_EXPENSE_LIMIT)
+        .all()
     )
 
+    return {
+        'count': expense_count,
+        'total_price': _money(total_price),
+        'total_tax': _money(total_tax),
+        'total_with_tax': _money(total_price + total_tax),
+        'by_category': [[c, _money(v)] for c, v in totals_by_category(summary)],
+        'by_project': [[p, _money(v)] for p, v in totals_by_project(summary)],
+        'by_month': [[month_label(y, m), _money(v)] for (y, m), v in totals_by_month(summary)],
+        'expenses': [{
+            'id': e.id,
+            'date': e.expenditure_date.isoformat(),
+            'item': e.item,
+            'description': (e.description[:80] + ('…' if len(e.description) > 80 else '')) if e.description else None,
+            'category': e.category,
+            'project': e.project.name,
+            'retailer': e.retailer.name if e.retailer else None,
+            'price': _money(e.price),
+            'tax': _money(e.effective_tax),
+            'tax_is_estimated': e.tax is None,
+            'total': _money(e.total_with_tax),
+        } for e in expenses],
+    }
+
 
 # ---------------------------------------------------------------------------
 # Expenses
@@ -133,8 +151,116 @@ def index():
 
 @bp.route('/expenses')
 def expenses():
-    expenses = HouseExpense.query.filter_by(is_active=True).order_by(HouseExpense.expenditure_date.desc()).all()
-    return render_template('house/expenses.html', expenses=expenses)
+    validators = page_validators(HouseExpense, sorted(request.args.items(multi=True)), get_version(DATA))
+    cached_page = not_modified(validators)
+    if cached_page is not None:
+        return cached_page
+
+    filters = expense_list_filters(request.args)
+    sort = request.args.get('sort', 'newest')
+    cursor = request.args.get('cursor')
+
+    try:
+        expenses, next_cursor = keyset_page(
+            HouseExpense.query.filter(*expense_criteria(**filters)).options(*EXPENSE_LIST_LOADS),
+            cursor=cursor,
+            newest_first=sort != 'oldest',
+            page_size=EXPENSE_PAGE_SIZE,
+        )
+    except ValueError:
+        abort(400)
+
+    next_url = None
+    if next_cursor:
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        next_url = url_for('house.expenses', **args)
+
+    all_projects = project_choices()
+    all_retailers = retailer_choices()
+    export_args = {k: v for k, v in request.args.items() if v and k not in ('cursor', 'sort')}
+
+    return conditional_response(render_template(
+        'house/expenses.html',
+        expenses=expenses,
+        next_url=next_url,
+        export_url=url_for('house.export_expenses', **export_args),
+        is_first_page=not cursor,
+        all_projects=all_projects,
+        all_retailers=all_retailers,
+        all_categories=HOUSE_EXPENSE_CATEGORIES,
+        sort=sort,
+        filters=filters,
+    ), validators)
+
+
+@bp.route('/expenses/export.csv')
+def export_expenses():
+    """Stream the filtered expenses as CSV, one batch of rows at a time."""
+    statement = export_statement(expense_criteria(**export_filters(request.args)))
+
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+
+        def drain():
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return chunk
+
+        writer.writerow(EXPORT_COLUMNS)
+        yield drain()
+        # yield_per streams from a server-side cursor where the driver has one
+        result = db.session.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for rows in result.partitions():
+            writer.writerows(rows)
+            yield drain()
+
+    filename = f'expenses-{date.today().isoformat()}.csv'
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
+
+
+@bp.route('/expenses/import', methods=['GET', 'POST'])
+def import_expenses():
+    form = ExpenseImportForm()
+    form.project_id.choices = [(p.id, p.name) for p in project_choices()]
+    result = None
+
+    if form.validate_on_submit():
+        try:
+            result = importer.import_expenses(
+                form.file.data,
+                project_id=form.project_id.data,
+                default_category=form.category.data,
+                create_retailers=form.create_retailers.data,
+                charge_sign=form.charge_sign.data,
+            )
+        except ValueError as exc:
+            db.session.rollback()
+            flash(f'Could not import the file: {exc}', 'danger')
+        else:
+            flash(f'Imported {result.imported} expenses.', 'success' if not result.error_count else 'warning')
+
+    return render_template('house/import.html', form=form, result=result)
+
+
+@bp.route('/expenses/suggest-items')
+def suggest_items():
+    """Type-ahead: the most used item names starting with ?q=, with their last price."""
+    suggestions = items.suggest_items(request.args.get('q', ''), limit=request.args.get('limit', 8, type=int))
+    return jsonify([{
+        'item': s.item,
+        'count': s.count,
+        'price': _money(s.price),
+        'category': s.category,
+        'retailer_id': s.retailer_id,
+        'retailer': s.retailer,
+    } for s in suggestions])
 
 
 @bp.route('/expenses/add', methods=['GET', 'POST'])
@@ -155,6 +281,9 @@ def add_expense():
             retailer_id=form.retailer_id.data if form.retailer_id.data else None,
         )
         db.session.add(expense)
+        rollups.record_change(None, rollups.snapshot(expense))
+        bump_version(DATA)
+        search.index_document(expense)
         db.session.commit()
         flash(f'Expense "{expense.item}" added.', 'success')
         return redirect(url_for('house.expenses'))
@@ -173,6 +302,7 @@ def edit_expense(expense_id):
     _populate_expense_form_choices(form)
 
     if form.validate_on_submit():
+        before = rollups.snapshot(expense)
         expense.expenditure_date = form.expenditure_date.data
         expense.price = form.price.data
         expense.tax = form.tax.data if form.tax.data is not None else None
@@ -181,6 +311,9 @@ def edit_expense(expense_id):
         expense.category = form.category.data
         expense.project_id = form.project_id.data
         expense.retailer_id = form.retailer_id.data if form.retailer_id.data else None
+        rollups.record_change(before, rollups.snapshot(expense))
+        bump_version(DATA)
+        search.index_document(expense)
         db.session.commit()
         flash(f'Expense "{expense.item}" updated.', 'success')
         return redirect(url_for('house.expenses'))
@@ -191,7 +324,11 @@ def edit_expense(expense_id):
 @bp.route('/expenses/<int:expense_id>/delete', methods=['POST'])
 def delete_expense(expense_id):
     expense = HouseExpense.query.get_or_404(expense_id)
+    before = rollups.snapshot(expense)
     expense.is_active = False
+    rollups.record_change(before, None)
+    bump_version(DATA)
+    search.index_document(expense)
     db.session.commit()
     flash(f'Expense "{expense.item}" removed.', 'info')
     return redirect(url_for('house.expenses'))
@@ -203,8 +340,19 @@ def delete_expense(expense_id):
 
 @bp.route('/projects')
 def projects():
-    projects = HouseProject.query.filter_by(is_active=True).order_by(HouseProject.name).all()
-    return render_template('house/projects.html', projects=projects)
+    # The totals columns read the expense table, which bumps DATA on every write
+    validators = page_validators(HouseProject, get_version(DATA))
+    cached_page = not_modified(validators)
+    if cached_page is not None:
+        return cached_page
+
+    projects = (
+        HouseProject.query.filter_by(is_active=True)
+        .options(undefer_group('totals'))
+        .order_by(HouseProject.name)
+        .all()
+    )
+    return conditional_response(render_template('house/projects.html', projects=projects), validators)
 
 
 @bp.route('/projects/add', methods=['GET', 'POST'])
@@ -223,6 +371,8 @@ def add_project():
             actual_end_date=form.actual_end_date.data,
         )
         db.session.add(project)
+        bump_version(CHOICES, DATA)
+        search.index_document(project)
         db.session.commit()
         if popup:
             payload = json.dumps({'type': 'newProject', 'id': project.id, 'name': project.name})
@@ -249,6 +399,8 @@ def edit_project(project_id):
         project.start_date = form.start_date.data
         project.estimated_end_date = form.estimated_end_date.data
         project.actual_end_date = form.actual_end_date.data
+        bump_version(CHOICES, DATA)
+        search.index_document(project)
         db.session.commit()
         flash(f'Project "{project.name}" updated.', 'success')
         return redirect(url_for('house.projects'))
@@ -260,6 +412,8 @@ def edit_project(project_id):
 def delete_project(project_id):
     project = HouseProject.query.get_or_404(project_id)
     project.is_active = False
+    bump_version(CHOICES, DATA)
+    search.index_document(project)
     db.session.commit()
     flash(f'Project "{project.name}" removed.', 'info')
     return redirect(url_for('house.projects'))
@@ -271,8 +425,26 @@ def delete_project(project_id):
 
 @bp.route('/retailers')
 def retailers():
-    retailers = Retailer.query.filter_by(is_active=True).order_by(Retailer.name).all()
-    return render_template('house/retailers.html', retailers=retailers)
+    # The expense counts read the expense table, which bumps DATA on every write
+    validators = page_validators(Retailer, get_version(DATA))
+    cached_page = not_modified(validators)
+    if cached_page is not None:
+        return cached_page
+
+    retailers = (
+        Retailer.query.filter_by(is_active=True)
+        .options(undefer_group('totals'))
+        .order_by(Retailer.name)
+        .all()
+    )
+    return conditional_response(render_template('house/retailers.html', retailers=retailers), validators)
+
+
+@bp.route('/retailers/suggest')
+def suggest_retailers():
+    """Type-ahead: active retailers whose names resemble ?q=, best first."""
+    matches = match_retailers(request.args.get('q', ''), limit=request.args.get('limit', 8, type=int))
+    return jsonify([{'id': m.id, 'name': m.name, 'score': m.score} for m in matches])
 
 
 @bp.route('/retailers/add', methods=['GET', 'POST'])
@@ -285,6 +457,7 @@ def add_retailer():
             website=form.website.data.strip() if form.website.data else None,
         )
         db.session.add(retailer)
+        bump_version(CHOICES, DATA)
         db.session.commit()
         if popup:
             payload = json.dumps({'type': 'newRetailer', 'id': retailer.id, 'name': retailer.name})
@@ -303,6 +476,7 @@ def edit_retailer(retailer_id):
     if form.validate_on_submit():
         retailer.name = form.name.data.strip()
         retailer.website = form.website.data.strip() if form.website.data else None
+        bump_version(CHOICES, DATA)
         db.session.commit()
         flash(f'Retailer "{retailer.name}" updated.', 'success')
         return redirect(url_for('house.retailers'))
@@ -313,6 +487,7 @@ def edit_retailer(retailer_id):
 def delete_retailer(retailer_id):
     retailer = Retailer.query.get_or_404(retailer_id)
     retailer.is_active = False
+    bump_version(CHOICES, DATA)
     db.session.commit()
     flash(f'Retailer "{retailer.name}" removed.', 'info')
     return redirect(url_for('house.retailers'))
@@ -0,0 +1,25 @@
+from flask import Blueprint, render_template, request
+from flask_login import login_required
+from app.search import RESULTS_PER_PAGE, SOURCES, highlight, search
+
+bp = Blueprint('search', __name__, url_prefix='/search')
+
+
+@bp.before_request
+@login_required
+def require_login():
+    pass
+
+
+@bp.route('/')
+def index():
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('kind', '')
+    if kind not in SOURCES:
+        kind = ''
+    page = max(request.args.get('page', 1, type=int), 1)
+    results, has_next = search(query, kind or None, page) if query else ([], False)
+    return render_template(
+        'search/results.html', query=query, kind=kind, kinds=list(SOURCES), page=page,
+        results=results, has_next=has_next, per_page=RESULTS_PER_PAGE, highlight=highlight,
+    )
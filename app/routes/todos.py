@@ -1,9 +1,14 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify
+from flask import Blueprint, render_template, redirect, url_for, request, flash, jsonify, current_app
 from flask_login import login_required
-from app import db
-from app.models import HouseTodo, HouseProject
+from app import db, search
+from app.models import HouseTodo
+from app.cache import CHOICES, get_version, project_choices
+from app.conditional import conditional_response, not_modified, page_validators
 from app.forms import HouseTodoForm
+from app.ranks import MAX_RANK_LENGTH, rank_after, rank_between, schedule_rebalance
 from datetime import datetime, date
+from sqlalchemy import case, func, select, update
+from sqlalchemy.orm import joinedload
 
 bp = Blueprint('todos', __name__, url_prefix='/house/todos')
 
@@ -15,8 +20,7 @@ def require_login():
 
 
 def _populate_todo_form_choices(form):
-    projects = HouseProject.query.filter_by(is_active=True).order_by(HouseProject.name).all()
-    form.project_id.choices = [(0, '— General House Upkeep —')] + [(p.id, p.name) for p in projects]
+    form.project_id.choices = [(0, '— General House Upkeep —')] + [(p.id, p.name) for p in project_choices()]
 
 
 # ---------------------------------------------------------------------------
@@ -25,11 +29,19 @@ def _populate_todo_form_choices(form):
 
 @bp.route('/')
 def index():
+    # Project names come from the choices cache; overdue badges depend on today
+    validators = page_validators(
+        HouseTodo, sorted(request.args.items(multi=True)), get_version(CHOICES), date.today(),
+    )
+    cached_page = not_modified(validators)
+    if cached_page is not None:
+        return cached_page
+
     sort_by = request.args.get('sort', 'priority')
     project_id = request.args.get('project_id', type=int)
     show_completed = request.args.get('show_completed') == '1'
 
-    query = HouseTodo.query.filter_by(is_active=True)
+    query = HouseTodo.query.filter_by(is_active=True).options(joinedload(HouseTodo.project))
 
     if not show_completed:
         query = query.filter_by(completed=False)
@@ -43,20 +55,20 @@ def index():
     if sort_by == 'due_date':
         query = query.order_by(
             HouseTodo.due_date.asc().nulls_last(),
-            HouseTodo.sort_order.asc()
+            HouseTodo.rank.asc()
         )
     elif sort_by == 'start_date':
         query = query.order_by(
             HouseTodo.start_date.asc().nulls_last(),
-            HouseTodo.sort_order.asc()
+            HouseTodo.rank.asc()
         )
     else:
-        query = query.order_by(HouseTodo.sort_order.asc(), HouseTodo.id.asc())
+        query = query.order_by(HouseTodo.rank.asc(), HouseTodo.id.asc())
 
     todos = query.all()
-    all_projects = HouseProject.query.filter_by(is_active=True).order_by(HouseProject.name).all()
+    all_projects = project_choices()
 
-    return render_template(
+    return conditional_response(render_template(
         'house/todos.html',
         todos=todos,
         all_projects=all_projects,
@@ -64,7 +76,7 @@ def index():
         filter_project_id=project_id,
         show_completed=show_completed,
         today=date.today(),
-    )
+    ), validators)
 
 
 # ---------------------------------------------------------------------------
@@ -77,7 +89,8 @@ def add_todo():
     _populate_todo_form_choices(form)
 
     if form.validate_on_submit():
-        max_order = db.session.query(db.func.max(HouseTodo.sort_order)).scalar() or 0
+        # Index-backed lookup of the current last rank
+        last_rank = db.session.query(db.func.max(HouseTodo.rank)).scalar()
         todo = HouseTodo(
             title=form.title.data.strip(),
             description=form.description.data.strip() if form.description.data else None,
@@ -85,10 +98,13 @@ def add_todo():
             start_date=form.start_date.data,
             due_date=form.due_date.data,
             priority=form.priority.data,
-            sort_order=max_order + 1,
+            rank=rank_after(last_rank),
         )
         db.session.add(todo)
+        search.index_document(todo)
         db.session.commit()
+        if len(todo.rank) > MAX_RANK_LENGTH:
+            schedule_rebalance(current_app._get_current_object())
         flash(f'"{todo.title}" added to your to-do list.', 'success')
         return redirect(url_for('todos.index'))
 
@@ -108,6 +124,7 @@ def edit_todo(todo_id):
         todo.start_date = form.start_date.data
         todo.due_date = form.due_date.data
         todo.priority = form.priority.data
+        search.index_document(todo)
         db.session.commit()
         flash(f'"{todo.title}" updated.', 'success')
         return redirect(url_for('todos.index'))
@@ -128,17 +145,79 @@ def complete_todo(todo_id):
     return jsonify({'completed': todo.completed, 'id': todo.id})
 
 
+@bp.route('/<int:todo_id>/move', methods=['POST'])
+def move_todo(todo_id):
+    """Move one to-do directly after after_id (or before before_id at the top).
+
+    Only the moved row is written. Its new rank goes between the anchor's rank
+    and the next rank in the whole table, so it never collides with a to-do
+    hidden by the current filters.
+    """
+    data = request.get_json(silent=True) or {}
+    todo = HouseTodo.query.get_or_404(todo_id)
+    others = HouseTodo.id != todo.id
+
+    try:
+        after_id = int(data['after_id']) if data.get('after_id') else None
+        before_id = int(data['before_id']) if data.get('before_id') else None
+    except (TypeError, ValueError):
+        return jsonify({'error': 'after_id and before_id must be integers'}), 400
+
+    if after_id:
+        anchor = db.session.get(HouseTodo, after_id)
+        if anchor is None:
+            return jsonify({'error': 'unknown after_id'}), 400
+        upper = db.session.scalar(select(func.min(HouseTodo.rank)).where(HouseTodo.rank > anchor.rank, others))
+        new_rank = rank_between(anchor.rank, upper)
+    elif before_id:
+        anchor = db.session.get(HouseTodo, before_id)
+        if anchor is None:
+            return jsonify({'error': 'unknown before_id'}), 400
+        lower = db.session.scalar(select(func.max(HouseTodo.rank)).where(HouseTodo.rank < anchor.rank, others))
+        new_rank = rank_between(lower, anchor.rank)
+    else:
+        return jsonify({'error': 'after_id or before_id is required'}), 400
+
+    todo.rank = new_rank
+    db.session.commit()
+    if len(new_rank) > MAX_RANK_LENGTH:
+        schedule_rebalance(current_app._get_current_object())
+    return jsonify({'ok': True, 'id': todo.id, 'rank': new_rank})
+
+
 @bp.route('/reorder', methods=['POST'])
 def reorder_todos():
+    """Apply a full ordering of the posted to-dos.
+
+    The ranks the posted to-dos already hold are redistributed among them in
+    the new order, so to-dos outside the posted set keep their positions.
+    """
     data = request.get_json()
     if not data:
         return jsonify({'error': 'no data'}), 400
-    for item in data:
-        todo = HouseTodo.query.get(item['id'])
-        if todo:
-            todo.sort_order = item['sort_order']
+    try:
+        ordering = {int(item['id']): int(item['sort_order']) for item in data}
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'each item needs an integer id and sort_order'}), 400
+
+    # Validate every id in one query, then apply the whole ordering in one UPDATE
+    current = dict(db.session.execute(
+        select(HouseTodo.id, HouseTodo.rank).where(HouseTodo.id.in_(ordering))
+    ).all())
+    updated = 0
+    if current:
+        ordered_ids = sorted(current, key=lambda todo_id: (ordering[todo_id], todo_id))
+        new_ranks = dict(zip(ordered_ids, sorted(current.values())))
+        new_rank = case(new_ranks, value=HouseTodo.id)
+        result = db.session.execute(
+            update(HouseTodo)
+            .where(HouseTodo.id.in_(current), HouseTodo.rank != new_rank)
+            .values(rank=new_rank)
+            .execution_options(synchronize_session=False)
+        )
+        updated = result.rowcount
     db.session.commit()
-    return jsonify({'ok': True})
+    return jsonify({'ok': True, 'updated': updated, 'unknown_ids': sorted(set(ordering) - set(current))})
 
 
 # ---------------------------------------------------------------------------
@@ -149,6 +228,7 @@ def reorder_todos():
 def delete_todo(todo_id):
     todo = HouseTodo.query.get_or_404(todo_id)
     todo.is_active = False
+    search.index_document(todo)
     db.session.commit()
     flash(f'"{todo.title}" removed.', 'info')
     return redirect(url_for('todos.index'))
@@ -0,0 +1,139 @@
+"""Full-text search across expenses, projects and to-dos.
+
+Every active row has one SearchDocument holding its title and body text.
+Routes that write a searchable row call index_document() before committing,
+so the document changes in the same transaction. Matching and ranking run on
+the database's own full-text index: FTS5 with bm25() on SQLite, a tsvector
+GIN index with ts_rank_cd() on Postgres. No query falls back to LIKE.
+"""
+import re
+from collections import namedtuple
+from markupsafe import Markup, escape
+from sqlalchemy import delete, func, insert, literal, literal_column, select, text, true
+from sqlalchemy.exc import OperationalError
+from app import db
+from app.models import HouseExpense, HouseProject, HouseTodo, SEARCH_TSVECTOR, SearchDocument
+
+# kind -> (model, title column, body column)
+SOURCES = {
+    'expense': (HouseExpense, 'item', 'description'),
+    'project': (HouseProject, 'name', 'description'),
+    'todo': (HouseTodo, 'title', 'description'),
+}
+KIND_OF = {model: kind for kind, (model, _, _) in SOURCES.items()}
+
+RESULTS_PER_PAGE = 20
+# Snippet highlight markers, replaced with <mark> after escaping
+_MARK_START, _MARK_END = '\x02', '\x03'
+
+Result = namedtuple('Result', 'kind ref_id title snippet score')
+
+
+def _source_select(kind):
+    model, title, body = SOURCES[kind]
+    return (
+        select(literal(kind), model.id, func.substr(getattr(model, title), 1, 200), getattr(model, body))
+        .where(model.is_active == true())
+    )
+
+
+def _insert_documents(bind, kind, *criteria):
+    bind.execute(insert(SearchDocument).from_select(
+        ['kind', 'ref_id', 'title', 'body'], _source_select(kind).where(*criteria),
+    ))
+
+
+# ---------------------------------------------------------------------------
+# Maintenance
+# ---------------------------------------------------------------------------
+
+def index_document(obj):
+    """Add, replace or (for a soft-deleted row) remove obj's search document."""
+    kind = KIND_OF[type(obj)]
+    _, title, body = SOURCES[kind]
+    if obj.id is None:
+        db.session.flush()
+    db.session.execute(
+        delete(SearchDocument).where(SearchDocument.kind == kind, SearchDocument.ref_id == obj.id)
+    )
+    if obj.is_active is not False:
+        db.session.execute(insert(SearchDocument).values(
+            kind=kind, ref_id=obj.id, title=(getattr(obj, title) or '')[:200], body=getattr(obj, body),
+        ))
+
+
+def index_expenses(ids):
+    """Add documents for newly inserted expenses, e.g. one import batch."""
+    _insert_documents(db.session, 'expense', HouseExpense.id.in_(ids))
+
+
+def rebuild(bind=None):
+    """Recreate every search document from the source tables."""
+    bind = bind if bind is not None else db.session
+    bind.execute(delete(SearchDocument))
+    for kind in SOURCES:
+        _insert_documents(bind, kind)
+
+
+# ---------------------------------------------------------------------------
+# Queries
+# ---------------------------------------------------------------------------
+
+def _terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def _search_sqlite(terms, kind, limit, offset):
+    # Quoted terms are stemmed like the index; the last one also matches as a prefix.
+    # FTS5 has no implicit AND next to a parenthesised group, so spell it out.
+    *words, last = terms
+    match = ' AND '.join([f'"{w}"' for w in words] + [f'("{last}" OR "{last}"*)'])
+    sql = (
+        'SELECT d.kind, d.ref_id, d.title, '
+        f"snippet(search_fts, -1, '{_MARK_START}', '{_MARK_END}', '…', 16) AS snippet, "
+        'bm25(search_fts, 10.0, 1.0) AS score '
+        'FROM search_fts JOIN search_documents d ON d.id = search_fts.rowid '
+        'WHERE search_fts MATCH :match' + (' AND d.kind = :kind' if kind else '') + ' '
+        'ORDER BY score, d.id LIMIT :limit OFFSET :offset'
+    )
+    try:
+        rows = db.session.execute(text(sql), {'match': match, 'kind': kind, 'limit': limit, 'offset': offset}).all()
+    except OperationalError:
+        # A query FTS5 still can't parse matches nothing rather than failing the page
+        return []
+    return [Result(r.kind, r.ref_id, r.title, r.snippet, -r.score) for r in rows]
+
+
+def _search_postgres(terms, kind, limit, offset):
+    query = func.to_tsquery('english', ' & '.join(terms[:-1] + [f'{terms[-1]}:*']))
+    document = literal_column(SEARCH_TSVECTOR)
+    score = func.ts_rank_cd(document, query).label('score')
+    snippet = func.ts_headline(
+        'english', SearchDocument.title + ' ' + func.coalesce(SearchDocument.body, ''), query,
+        f'StartSel={_MARK_START}, StopSel={_MARK_END}, MaxWords=24, MinWords=8',
+    ).label('snippet')
+    statement = (
+        select(SearchDocument.kind, SearchDocument.ref_id, SearchDocument.title, snippet, score)
+        .where(document.op('@@')(query))
+        .order_by(score.desc(), SearchDocument.id)
+        .limit(limit)
+        .offset(offset)
+    )
+    if kind:
+        statement = statement.where(SearchDocument.kind == kind)
+    return [Result(r.kind, r.ref_id, r.title, r.snippet, float(r.score)) for r in db.session.execute(statement)]
+
+
+def search(query, kind=None, page=1, per_page=RESULTS_PER_PAGE):
+    """Return (results, has_next) for one page of matches, best first."""
+    terms = _terms(query)
+    if not terms:
+        return [], False
+    search_fn = _search_postgres if db.engine.dialect.name == 'postgresql' else _search_sqlite
+    results = search_fn(terms, kind if kind in SOURCES else None, per_page + 1, (page - 1) * per_page)
+    return results[:per_page], len(results) > per_page
+
+
+def highlight(snippet):
+    """Escape a result snippet and turn its match markers into <mark> tags."""
+    return Markup(str(escape(snippet or '')).replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>'))
@@ -0,0 +1,133 @@
+"""Per-request SQL statistics: query count, database time and N+1 detection.
+
+init_app() listens to the cursor events of the app's engines. On a sampled
+request (SQL_STATS_SAMPLE_RATE, every request in development) each statement
+is timed and counted by its SQL text. Parameters are not part of the text, so
+a loop that loads one row per iteration shows up as one statement repeated;
+any statement run SQL_STATS_REPEAT_THRESHOLD times or more is flagged.
+
+The database time covers cursor.execute() only, not fetching the rows. On
+Postgres the server has finished the query by then, but SQLite produces rows
+as they are fetched, so there db time under-reports queries that return many
+rows; their remaining cost shows up in the app time.
+
+Sampled responses get a Server-Timing header, which the browser's dev tools
+show under the request's timing, and one JSON log line on the 'app.sqlstats'
+logger (a warning when something was flagged). Unsampled requests only pay
+for a dictionary lookup per statement. Streamed responses are measured up to
+the point the stream starts.
+"""
+import json
+import logging
+import random
+import time
+from collections import Counter
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from app import db
+
+logger = logging.getLogger(__name__)
+
+# Longest SQL text quoted in the log line for a flagged statement
+LOGGED_SQL_LENGTH = 300
+
+
+class QueryStats:
+    """The statements one request ran and the time spent in them."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.statements[statement] += 1
+
+    def repeated(self, threshold):
+        """(statement, times run) for statements run at least threshold times, most first."""
+        return [(sql, n) for sql, n in self.statements.most_common() if n >= threshold]
+
+
+def _current_stats():
+    return g.get('sql_stats') if has_app_context() else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats() is not None:
+        conn.info.setdefault('sql_stats_started', []).append((context, time.perf_counter()))
+
+
+def _stop_timer(conn, context, statement):
+    stats = _current_stats()
+    started = conn.info.get('sql_stats_started')
+    if started and started[-1][0] is context:
+        seconds = time.perf_counter() - started.pop()[1]
+        if stats is not None:
+            stats.record(statement, seconds)
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    _stop_timer(conn, context, statement)
+
+
+def _handle_error(exception_context):
+    # A statement that fails never reaches after_cursor_execute; count it here
+    # so its start time doesn't stay behind on the connection
+    if exception_context.connection is not None:
+        _stop_timer(exception_context.connection, exception_context.execution_context, exception_context.statement)
+
+
+def _start_request():
+    rate = current_app.config['SQL_STATS_SAMPLE_RATE']
+    if rate >= 1 or (rate > 0 and random.random() < rate):
+        g.sql_stats = QueryStats()
+
+
+def _finish_request(response):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return response
+    repeated = stats.repeated(current_app.config['SQL_STATS_REPEAT_THRESHOLD'])
+    db_ms = stats.seconds * 1000
+    total_ms = (time.perf_counter() - stats.started) * 1000
+
+    response.headers.add('Server-Timing', f'db;dur={db_ms:.1f};desc="{stats.count} queries"')
+    if repeated:
+        response.headers.add('Server-Timing', f'n1;desc="{len(repeated)} repeated statements"')
+    response.headers.add('Server-Timing', f'app;dur={total_ms:.1f}')
+
+    line = {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'queries': stats.count,
+        'distinct_queries': len(stats.statements),
+        'db_ms': round(db_ms, 1),
+        'total_ms': round(total_ms, 1),
+    }
+    if repeated:
+        line['repeated'] = [{'sql': sql[:LOGGED_SQL_LENGTH], 'count': n} for sql, n in repeated]
+        logger.warning(json.dumps(line))
+    else:
+        logger.info(json.dumps(line))
+    return response
+
+
+def init_app(app):
+    """Time the app's SQL per request and report it on sampled responses."""
+    if logger.level == logging.NOTSET:
+        logger.setLevel(logging.INFO)
+    # Makes Flask attach its stderr handler to the 'app' logger, which ours propagates to
+    app.logger
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(engine, 'handle_error', _handle_error)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
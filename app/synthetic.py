@@ -0,0 +1,308 @@
+"""Synthetic data for load testing (`flask seed-synthetic`).
+
+Generates projects, retailers, expenses and to-dos that look like a real
+renovation ledger: expense categories in realistic proportions, log-normal
+prices per category, item and retailer popularity following a Zipf curve,
+and expense dates inside their project's active period. Dates count back
+from --until, which defaults to today, so only the same seed and arguments
+with an explicit --until, run against an empty database, produce the same
+rows. created_at and updated_at are always the time of the run.
+
+Rows are inserted with Core executemany in batches of SEED_BATCH_SIZE, each
+batch its own transaction. For large runs the secondary indexes on
+house_expenses are dropped first and rebuilt at the end, which is much faster
+than updating them row by row; rollups and search documents are likewise
+rebuilt once at the end. This is a tool for development databases only.
+"""
+import bisect
+import itertools
+import math
+import random
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from contextlib import contextmanager
+from sqlalchemy import func, literal_column, select, true
+from app import cache, db, rollups, search
+from app.models import (
+    HouseExpense, HouseProject, HouseTodo, Retailer, TAX_RATE, TODO_PRIORITIES, normalize_retailer_name,
+)
+from app.ranks import MAX_RANK_LENGTH, rank_after, rank_sequence, rebalance_todos
+
+# Rows inserted and committed per transaction
+SEED_BATCH_SIZE = 10000
+# Expense counts from which the expense indexes are rebuilt instead of maintained
+DEFER_INDEXES_ROWS = 100000
+
+# category -> (share of expenses, median price, log-normal sigma, items)
+CATEGORY_PROFILES = {
+    'Materials': (0.46, 42, 1.1, [
+        '2x4 stud 8ft', 'Drywall sheet 4x8', 'Deck screws', 'Interior paint gallon', 'Primer gallon',
+        'Joint compound', 'Plywood 3/4in', 'Wood glue', 'Caulk', 'Tile adhesive', 'Floor tile',
+        'Grout', 'Insulation batts', 'PVC pipe', 'Copper fitting', 'Romex 12/2', 'Outlet box',
+        'Light switch', 'Sandpaper pack', 'Painter tape', 'Concrete mix', 'Baseboard trim',
+        'Cabinet hinges', 'Vinyl plank flooring', 'Roofing nails', 'Shingles bundle',
+    ]),
+    'Labor': (0.12, 650, 0.8, [
+        'Electrician', 'Plumber', 'Drywall install', 'Tile setter', 'Painter', 'Carpenter',
+        'Roofer', 'HVAC technician', 'General contractor', 'Demolition crew',
+    ]),
+    'Permit': (0.02, 150, 0.6, [
+        'Building permit', 'Electrical permit', 'Plumbing permit', 'Mechanical permit',
+    ]),
+    'Appliance': (0.04, 900, 0.5, [
+        'Refrigerator', 'Dishwasher', 'Range', 'Range hood', 'Washer', 'Dryer', 'Water heater',
+        'Microwave', 'Garbage disposal',
+    ]),
+    'Tool & Equipment': (0.12, 75, 0.9, [
+        'Drill bits', 'Circular saw blade', 'Tile saw rental', 'Ladder', 'Shop vac', 'Stud finder',
+        'Level', 'Utility knife blades', 'Paint rollers', 'Respirator', 'Dumpster rental',
+    ]),
+    'Service & Inspection': (0.05, 300, 0.6, [
+        'Home inspection', 'Electrical inspection', 'Radon test', 'Asbestos test',
+        'Septic inspection', 'Chimney sweep', 'Pest inspection',
+    ]),
+    'Other': (0.19, 28, 1.0, [
+        'Lunch for crew', 'Delivery fee', 'Storage unit', 'Cleaning supplies', 'Trash bags',
+        'Gas for truck', 'Parking', 'Coffee',
+    ]),
+}
+
+RETAILER_CHAINS = [
+    'Home Depot', "Lowe's", 'Ace Hardware', 'Menards', 'Sherwin-Williams', 'Harbor Freight',
+    'Costco', 'Amazon', 'Best Buy', 'Ferguson', 'Floor & Decor', 'True Value',
+    'Local Lumber Co.', 'Tractor Supply', 'Habitat ReStore', 'Appliance Outlet',
+]
+ROOMS = [
+    'Kitchen', 'Master Bath', 'Guest Bath', 'Basement', 'Living Room', 'Bedroom', 'Garage',
+    'Deck', 'Attic', 'Laundry Room', 'Roof', 'Exterior', 'Yard', 'Office',
+]
+PROJECT_KINDS = ['Remodel', 'Refresh', 'Repair', 'Upgrade', 'Renovation', 'Build-out']
+# status -> share of projects
+PROJECT_STATUSES = {'completed': 0.45, 'in-progress': 0.25, 'planning': 0.15, 'on-hold': 0.1, 'abandoned': 0.05}
+TODO_VERBS = ['Fix', 'Replace', 'Clean', 'Paint', 'Inspect', 'Caulk', 'Seal', 'Patch', 'Install', 'Order']
+TODO_OBJECTS = [
+    'gutters', 'dripping faucet', 'furnace filter', 'smoke detectors', 'bathroom grout', 'deck boards',
+    'garage door opener', 'window screens', 'baseboards', 'dryer vent', 'fence gate', 'attic insulation',
+]
+
+# Share of expenses that are soft-deleted, have an explicit tax, a retailer, or notes
+DELETED_SHARE = 0.02
+EXPLICIT_TAX_SHARE = 0.25
+RETAILER_SHARE = 0.85
+NOTES_SHARE = 0.1
+
+
+def _zipf_weights(n, s=1.1):
+    return list(itertools.accumulate(1 / (rank + 1) ** s for rank in range(n)))
+
+
+def _picker(rnd, values, cum_weights):
+    """A function returning one of values at random, like rnd.choices() but cheaper per call."""
+    random, total, last = rnd.random, cum_weights[-1], len(values) - 1
+    return lambda: values[bisect.bisect(cum_weights, random() * total, 0, last)]
+
+
+class SyntheticData:
+    """Deterministic generator of synthetic rows; call the insert_* methods in order."""
+
+    def __init__(self, seed=0, until=None, years=5):
+        self.rnd = random.Random(seed)
+        self.until = until or date.today()
+        self.since = self.until - timedelta(days=365 * years)
+        self.now = datetime.utcnow()
+        # The same timestamp for every row, inlined so executemany doesn't convert it per row
+        self.now_sql = literal_column(f"'{self.now.isoformat(' ')}'")
+        self.projects = []   # (id, first day ordinal, length in days)
+        self.retailer_ids = []
+
+    def _insert(self, table, rows, returning=False):
+        statement = table.insert().values(created_at=self.now_sql, updated_at=self.now_sql)
+        if returning:
+            ids = db.session.scalars(statement.returning(table.c.id), rows).all()
+        else:
+            db.session.execute(statement, rows)
+            ids = None
+        db.session.commit()
+        return ids
+
+    def _batches(self, count, make_row, table, progress=None):
+        done = 0
+        while done < count:
+            size = min(SEED_BATCH_SIZE, count - done)
+            self._insert(table, [make_row() for _ in range(size)])
+            done += size
+            if progress:
+                progress(done)
+
+    # -- Retailers and projects --------------------------------------------
+
+    def insert_retailers(self, count):
+        rows = []
+        for i in range(count):
+            chain = RETAILER_CHAINS[i % len(RETAILER_CHAINS)]
+            name = chain if i < len(RETAILER_CHAINS) else f'{chain} #{i // len(RETAILER_CHAINS) + 100}'
+            rows.append({
+                'name': name, 'normalized_name': normalize_retailer_name(name), 'website': None,
+                'is_active': True,
+            })
+        self.retailer_ids = self._insert(Retailer.__table__, rows, returning=True) if rows else []
+
+    def insert_projects(self, count):
+        rnd = self.rnd
+        statuses, shares = zip(*PROJECT_STATUSES.items())
+        span = (self.until - self.since).days
+        rows, windows = [], []
+        for i in range(count):
+            room = ROOMS[i % len(ROOMS)]
+            kind = rnd.choice(PROJECT_KINDS)
+            status = rnd.choices(statuses, shares)[0]
+            start = self.since + timedelta(days=rnd.randrange(span))
+            length = max(7, int(rnd.lognormvariate(math.log(60), 0.7)))
+            end = min(start + timedelta(days=length), self.until)
+            rows.append({
+                'name': f'{room} {kind}' if i < len(ROOMS) else f'{room} {kind} {start.year}',
+                'description': f'{kind} of the {room.lower()}.',
+                'status': status,
+                'budget': Decimal(round(rnd.lognormvariate(math.log(8000), 0.9))),
+                'room': room,
+                'start_date': start,
+                'estimated_end_date': start + timedelta(days=length),
+                'actual_end_date': end if status == 'completed' else None,
+                'is_active': True,
+            })
+            windows.append((start.toordinal(), (end - start).days + 1))
+        ids = self._insert(HouseProject.__table__, rows, returning=True) if rows else []
+        self.projects = [(project_id, *window) for project_id, window in zip(ids, windows)]
+
+    def load_existing(self):
+        """Use existing projects and retailers when this run doesn't create any."""
+        if not self.projects:
+            for project_id, start in db.session.execute(
+                select(HouseProject.id, HouseProject.start_date).where(HouseProject.is_active == true())
+            ):
+                start = start or self.since
+                self.projects.append((project_id, start.toordinal(), max((self.until - start).days, 0) + 1))
+        if not self.retailer_ids:
+            self.retailer_ids = db.session.scalars(select(Retailer.id).where(Retailer.is_active == true())).all()
+
+    # -- Expenses ------------------------------------------------------------
+
+    def insert_expenses(self, count, progress=None):
+        if not count:
+            return
+        if not self.projects:
+            raise ValueError('Expenses need at least one project.')
+        rnd = self.rnd
+        random = rnd.random
+        pick_category = _picker(rnd, list(CATEGORY_PROFILES.items()),
+                                list(itertools.accumulate(p[0] for p in CATEGORY_PROFILES.values())))
+        pick_item = {c: _picker(rnd, p[3], _zipf_weights(len(p[3]))) for c, p in CATEGORY_PROFILES.items()}
+        pick_project = _picker(rnd, self.projects, _zipf_weights(len(self.projects), s=0.8))
+        pick_retailer = (_picker(rnd, self.retailer_ids, _zipf_weights(len(self.retailer_ids)))
+                         if self.retailer_ids else None)
+        tax_per_mille = int(TAX_RATE * 1000)
+        until, from_ordinal = self.until.toordinal(), date.fromordinal
+
+        def money(cents):
+            return Decimal(cents).scaleb(-2)
+
+        def make_row():
+            category, (_, median, sigma, _) = pick_category()
+            price_cents = min(max(round(rnd.lognormvariate(math.log(median), sigma) * 100), 50), 5_000_000)
+            if random() < EXPLICIT_TAX_SHARE:
+                tax_cents = round(price_cents * random() * 0.1)
+                tax = money(tax_cents)
+            else:
+                # Matches expense_amounts(): TAX_RATE of the price, rounded half to even
+                tax_cents, remainder = divmod(price_cents * tax_per_mille, 1000)
+                if remainder > 500 or (remainder == 500 and tax_cents % 2):
+                    tax_cents += 1
+                tax = None
+            project_id, first, length = pick_project()
+            spent = first + int(random() * length)
+            return {
+                'expenditure_date': from_ordinal(spent),
+                'entered_date': from_ordinal(min(spent + int(random() * 8), until)),
+                'price': money(price_cents),
+                'tax': tax,
+                'effective_tax': money(tax_cents),
+                'total_with_tax': money(price_cents + tax_cents),
+                'item': pick_item[category](),
+                'description': 'Synthetic note' if random() < NOTES_SHARE else None,
+                'category': category,
+                'retailer_id': pick_retailer() if pick_retailer and random() < RETAILER_SHARE else None,
+                'project_id': project_id,
+                'is_active': random() >= DELETED_SHARE,
+            }
+
+        self._batches(count, make_row, HouseExpense.__table__, progress)
+
+    # -- To-dos ------------------------------------------------------------------
+
+    def insert_todos(self, count):
+        if not count:
+            return
+        rnd = self.rnd
+        # Appended after the current last to-do, evenly spaced like a rebalance
+        prefix = rank_after(db.session.scalar(select(func.max(HouseTodo.rank))))
+        ranks = rank_sequence(count)
+        longest_rank = len(prefix) + max(map(len, ranks))
+        ranks = iter(ranks)
+        project_ids = [p[0] for p in self.projects]
+        span = (self.until - self.since).days
+
+        def make_row():
+            start = self.since + timedelta(days=rnd.randrange(span))
+            completed = rnd.random() < 0.3
+            return {
+                'title': f'{rnd.choice(TODO_VERBS)} {rnd.choice(TODO_OBJECTS)}',
+                'description': None,
+                'project_id': rnd.choice(project_ids) if project_ids and rnd.random() < 0.6 else None,
+                'start_date': start,
+                'due_date': start + timedelta(days=rnd.randrange(1, 60)) if rnd.random() < 0.7 else None,
+                'priority': rnd.choices(TODO_PRIORITIES, [0.2, 0.5, 0.3])[0],
+                'sort_order': 0,
+                'rank': prefix + next(ranks),
+                'completed': completed,
+                'completed_at': datetime.combine(start, datetime.min.time()) if completed else None,
+                'is_active': True,
+            }
+
+        self._batches(count, make_row, HouseTodo.__table__)
+        if longest_rank > MAX_RANK_LENGTH:
+            rebalance_todos()
+
+
+@contextmanager
+def _indexes_deferred(table):
+    """Drop table's secondary indexes for the duration of the block, then recreate them."""
+    indexes = sorted(table.indexes, key=lambda index: index.name)
+    for index in indexes:
+        index.drop(db.session.connection(), checkfirst=True)
+    db.session.commit()
+    try:
+        yield
+    finally:
+        db.session.rollback()
+        for index in indexes:
+            index.create(db.session.connection(), checkfirst=True)
+        db.session.commit()
+
+
+def seed_synthetic(expenses, projects, retailers, todos, seed=0, until=None, years=5, progress=None):
+    """Insert synthetic rows, then rebuild the rollups and search documents."""
+    data = SyntheticData(seed, until, years)
+    data.insert_retailers(retailers)
+    data.insert_projects(projects)
+    data.load_existing()
+    if expenses >= DEFER_INDEXES_ROWS:
+        with _indexes_deferred(HouseExpense.__table__):
+            data.insert_expenses(expenses, progress)
+    else:
+        data.insert_expenses(expenses, progress)
+    data.insert_todos(todos)
+
+    rollups.rebuild()
+    search.rebuild()
+    cache.bump_version(cache.DATA, cache.CHOICES, cache.EXPENSE_YEARS)
+    db.session.commit()
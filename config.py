@@ -1,18 +1,65 @@
 import os
 
 class Config:
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key-change-in-production'
+    DEBUG = False
+    SECRET_KEY = os.environ.get('SECRET_KEY') or 'dev-secret-key'
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///budget.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Connection pool (Postgres); see engine_options()
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.environ.get('DB_POOL_TIMEOUT', 30))
+    # Reconnect before the server or a firewall drops an idle connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') != '0'
+    # Server-side limit per statement during web requests (app/engine.py), so
+    # CLI maintenance like rebuild-rollups isn't cut off; 0 turns it off
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))
+
+    # SQLite PRAGMAs applied to every new connection (app/engine.py). WAL lets
+    # readers run alongside the one writer, and the busy timeout makes a second
+    # writer wait for the lock instead of failing with "database is locked".
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+    # Share of requests whose SQL is timed and logged (app/sqlstats.py)
+    SQL_STATS_SAMPLE_RATE = float(os.environ.get('SQL_STATS_SAMPLE_RATE', 1))
+    # Runs of one statement within a request at which it is flagged as N+1
+    SQL_STATS_REPEAT_THRESHOLD = int(os.environ.get('SQL_STATS_REPEAT_THRESHOLD', 5))
+
+    # /health answers 503 past either limit (app/health.py)
+    HEALTH_TIMEOUT_SECONDS = float(os.environ.get('HEALTH_TIMEOUT_SECONDS', 2))
+    HEALTH_MAX_LATENCY_MS = float(os.environ.get('HEALTH_MAX_LATENCY_MS', 250))
+
 class DevelopmentConfig(Config):
     DEBUG = True
 
 class ProductionConfig(Config):
     DEBUG = False
+    SQL_STATS_SAMPLE_RATE = float(os.environ.get('SQL_STATS_SAMPLE_RATE', 0.01))
 
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
-    'default': DevelopmentConfig
+    'default': Config
 }
+
+
+def engine_options(settings):
+    """SQLALCHEMY_ENGINE_OPTIONS for the configured database URI.
+
+    Postgres gets a sized, pre-pinged, recycled pool. SQLite needs no engine
+    options; its tuning is done with PRAGMAs on connect.
+    """
+    if not settings['SQLALCHEMY_DATABASE_URI'].startswith('postgresql'):
+        return {}
+    return {
+        'pool_size': settings['DB_POOL_SIZE'],
+        'max_overflow': settings['DB_MAX_OVERFLOW'],
+        'pool_timeout': settings['DB_POOL_TIMEOUT'],
+        'pool_recycle': settings['DB_POOL_RECYCLE'],
+        'pool_pre_ping': settings['DB_POOL_PRE_PING'],
+    }
@@ -0,0 +1,27 @@
+"""Gunicorn settings for the Docker image (see Dockerfile)."""
+import os
+import shutil
+
+bind = '0.0.0.0:5000'
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+
+
+def on_starting(server):
+    # Samples left over from a previous run would be merged into /metrics
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+
+
+def post_worker_init(worker):
+    # Builds the item suggestion index before the first keystroke needs it
+    from app import items
+    items.warm_in_background(worker.wsgi)
+
+
+def child_exit(server, worker):
+    # Drops the exited worker's live gauges (requests in flight) from /metrics
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,66 @@
+import os
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+
+# config.py reads DATABASE_URL when create_app() first imports it
+_db_fd, _db_path = tempfile.mkstemp(suffix='.db')
+os.environ['DATABASE_URL'] = f'sqlite:///{_db_path}'
+
+from app import create_app, db  # noqa: E402
+
+PROJECTS = 30
+RETAILERS = 30
+EXPENSES = 600
+
+
+def _seed():
+    from app import rollups, search
+    from app.models import HouseExpense, HouseProject, Retailer, User
+
+    user = User(username='tester')
+    user.set_password('secret')
+    projects = [HouseProject(name=f'Project {i}') for i in range(PROJECTS)]
+    retailers = [Retailer(name=f'Retailer {i}') for i in range(RETAILERS)]
+    db.session.add_all([user, *projects, *retailers])
+    db.session.flush()
+    for i in range(EXPENSES):
+        db.session.add(HouseExpense(
+            expenditure_date=date(2023, 1, 1) + timedelta(days=i % 700),
+            price=Decimal(100 + i) / 100,
+            item=f'Item {i}',
+            category='Materials',
+            project_id=projects[i % PROJECTS].id,
+            retailer_id=retailers[i % RETAILERS].id if i % 3 else None,
+            is_active=i % 17 != 0,
+        ))
+    db.session.commit()
+    rollups.rebuild()
+    search.rebuild()
+    db.session.commit()
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    with app.app_context():
+        from app.migrations import upgrade
+        upgrade()
+        _seed()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+    os.close(_db_fd)
+    for path in (_db_path, f'{_db_path}-wal', f'{_db_path}-shm'):
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.post('/login', data={'username': 'tester', 'password': 'secret'})
+    return client
@@ -0,0 +1,53 @@
+from sqlalchemy import select
+
+from app import cache, db, rollups
+from app.models import HouseProject
+
+NEW_YEAR = 2031
+
+
+def _use_worker_cache(entries):
+    """Make entries this process's cache, standing in for one gunicorn worker's copy."""
+    cache._entries.clear()
+    cache._entries.update(entries)
+
+
+def _expense_years(app, entries):
+    """Return (years, cache entries after the lookup) for a request on the worker holding entries."""
+    _use_worker_cache(entries)
+    with app.app_context():
+        years = cache.expense_years()
+    return years, dict(cache._entries)
+
+
+def _apply_count(app, count, writer_entries):
+    _use_worker_cache(writer_entries)
+    with app.app_context():
+        project_id = db.session.scalars(select(HouseProject.id)).first()
+        rollups.apply_deltas({(NEW_YEAR, 3, project_id, 'Materials', None): (1000 * count, 55 * count, count)})
+        db.session.commit()
+
+
+def _expense_years_version(app):
+    with app.app_context():
+        return cache.get_version(cache.EXPENSE_YEARS)
+
+
+def test_year_changes_reach_workers_that_did_not_write(app):
+    saved = dict(cache._entries)
+    try:
+        years, worker_b = _expense_years(app, {})
+        assert NEW_YEAR not in years
+
+        # Worker A, which has nothing cached, adds the year's first expense
+        _apply_count(app, 1, {})
+        years, worker_b = _expense_years(app, worker_b)
+        assert NEW_YEAR in years
+
+        # Worker A, holding a stale list without the year, removes its last expense
+        stale = {'expense_years': (_expense_years_version(app), [])}
+        _apply_count(app, -1, stale)
+        years, worker_b = _expense_years(app, worker_b)
+        assert NEW_YEAR not in years
+    finally:
+        _use_worker_cache(saved)
@@ -0,0 +1,20 @@
+from app import db
+from app.models import HouseProject, Retailer
+
+
+def test_retailers_page_changes_when_an_expense_is_added(app, client):
+    first = client.get('/house/retailers')
+    etag = first.headers['ETag']
+    assert client.get('/house/retailers', headers={'If-None-Match': etag}).status_code == 304
+
+    with app.app_context():
+        project = db.session.scalars(db.select(HouseProject)).first()
+        retailer = db.session.scalars(db.select(Retailer)).first()
+    # Following the redirect shows the flash message, which would skip validation
+    response = client.post('/house/expenses/add', follow_redirects=True, data={
+        'expenditure_date': '2024-05-01', 'item': 'Drywall screws', 'price': '8.50',
+        'category': 'Materials', 'project_id': project.id, 'retailer_id': retailer.id,
+    })
+    assert response.status_code == 200
+
+    assert client.get('/house/retailers', headers={'If-None-Match': etag}).status_code == 200
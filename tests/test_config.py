@@ -0,0 +1,15 @@
+import pytest
+
+from app import create_app
+from config import Config, config
+
+
+def test_unknown_flask_env_fails(monkeypatch):
+    monkeypatch.setenv('FLASK_ENV', 'prodcution')
+    with pytest.raises(ValueError, match='prodcution'):
+        create_app()
+
+
+def test_unset_flask_env_is_not_debug():
+    assert config['default'] is Config
+    assert not Config.DEBUG
@@ -0,0 +1,27 @@
+from types import SimpleNamespace
+
+from app.engine import _statement_timeout
+
+
+class FakeConnection:
+    dialect = SimpleNamespace(name='postgresql')
+
+    def __init__(self):
+        self.statements = []
+
+    def exec_driver_sql(self, statement):
+        self.statements.append(statement)
+
+
+def test_statement_timeout_applies_to_web_requests(app):
+    connection = FakeConnection()
+    with app.test_request_context():
+        _statement_timeout(None, None, connection)
+    assert connection.statements == [f"SET LOCAL statement_timeout = {app.config['DB_STATEMENT_TIMEOUT_MS']}"]
+
+
+def test_statement_timeout_skips_cli_commands(app):
+    connection = FakeConnection()
+    with app.app_context():
+        _statement_timeout(None, None, connection)
+    assert connection.statements == []
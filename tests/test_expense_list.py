@@ -0,0 +1,103 @@
+import re
+from datetime import date, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+
+from app import db
+from app.models import HouseExpense, HouseProject
+from app.queries import decode_cursor, encode_cursor, expense_criteria, keyset_page
+
+TIED_DAY = date(2024, 6, 15)
+
+
+@pytest.fixture
+def tied_project_id(app):
+    """A project with 25 expenses on one day and 5 on the days around it."""
+    with app.app_context():
+        project = HouseProject(name='Tied project')
+        db.session.add(project)
+        db.session.flush()
+        days = [TIED_DAY] * 25 + [TIED_DAY + timedelta(days=d) for d in (-2, -1, 1, 2, 3)]
+        db.session.add_all([
+            HouseExpense(expenditure_date=day, price=Decimal('1.00'), item=f'Tied {i}',
+                         category='Materials', project_id=project.id)
+            for i, day in enumerate(days)
+        ])
+        db.session.commit()
+        yield project.id
+        db.session.execute(db.delete(HouseExpense).where(HouseExpense.project_id == project.id))
+        db.session.delete(project)
+        db.session.commit()
+
+
+def _expected_ids(newest_first, **filters):
+    order = (HouseExpense.expenditure_date, HouseExpense.id)
+    if newest_first:
+        order = tuple(column.desc() for column in order)
+    return db.session.scalars(
+        db.select(HouseExpense.id).where(*expense_criteria(**filters)).order_by(*order)
+    ).all()
+
+
+def _walk(client, url):
+    """Follow the list's Load more links from url; return the expense ids in order."""
+    ids = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        html = response.get_data(as_text=True)
+        ids += dict.fromkeys(int(i) for i in re.findall(r'/house/expenses/(\d+)/edit', html))
+        more = re.search(r'href="([^"]+)" id="loadMore"', html)
+        url = more.group(1).replace('&amp;', '&') if more else None
+    return ids
+
+
+def test_cursor_round_trips():
+    cursor = encode_cursor(SimpleNamespace(expenditure_date=date(2024, 2, 29), id=42))
+    assert decode_cursor(cursor) == (date(2024, 2, 29), 42)
+
+
+@pytest.mark.parametrize('cursor', [
+    'garbage', '2024-01-01', '2024-13-01.5', '2024-01-01.x', '2024-01-01.1.2',
+    '2024-01-01.-1', '2024-01-01.99999999999999999999',
+])
+def test_decode_rejects_malformed_cursors(cursor):
+    assert decode_cursor(cursor) is None
+
+
+@pytest.mark.parametrize('newest_first', [True, False])
+def test_keyset_pages_cover_every_row_once(app, newest_first):
+    with app.app_context():
+        query = HouseExpense.query.filter(*expense_criteria())
+        ids, cursor = [], None
+        while True:
+            page, cursor = keyset_page(query, cursor, newest_first, page_size=37)
+            ids += [e.id for e in page]
+            if cursor is None:
+                break
+        assert ids == _expected_ids(newest_first)
+
+
+@pytest.mark.parametrize('cursor', ['garbage', '2024-13-01.5', '2024-01-01.99999999999999999999'])
+def test_malformed_cursor_is_a_bad_request(client, cursor):
+    assert client.get('/house/expenses', query_string={'cursor': cursor}).status_code == 400
+
+
+@pytest.mark.parametrize('sort', ['newest', 'oldest'])
+def test_paging_with_filters(app, client, sort):
+    start, end = date(2023, 3, 1), date(2024, 6, 30)
+    ids = _walk(client, f'/house/expenses?sort={sort}&start={start}&end={end}')
+    with app.app_context():
+        assert ids == _expected_ids(sort == 'newest', start=start, end=end)
+    assert len(ids) > 50
+
+
+@pytest.mark.parametrize('sort', ['newest', 'oldest'])
+def test_paging_through_ties(app, client, monkeypatch, tied_project_id, sort):
+    monkeypatch.setattr('app.routes.house.EXPENSE_PAGE_SIZE', 4)
+    ids = _walk(client, f'/house/expenses?sort={sort}&project_id={tied_project_id}')
+    with app.app_context():
+        assert ids == _expected_ids(sort == 'newest', project_id=tied_project_id)
+    assert len(ids) == 30
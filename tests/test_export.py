@@ -0,0 +1,88 @@
+import csv
+import io
+import re
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app import db
+from app.models import HouseExpense, HouseProject, Retailer
+from app.routes.house import EXPORT_COLUMNS
+
+
+@pytest.fixture
+def taxed_project_id(app):
+    """A project with one expense whose tax was entered and one left to the default rate."""
+    with app.app_context():
+        project = HouseProject(name='Export project')
+        db.session.add(project)
+        db.session.flush()
+        db.session.add_all([
+            HouseExpense(expenditure_date=date(2024, 5, 1), price=Decimal('12.50'), tax=Decimal('3.21'),
+                         item='Entered tax', category='Tools', project_id=project.id),
+            HouseExpense(expenditure_date=date(2024, 5, 2), price=Decimal('10.00'),
+                         item='Default tax', category='Tools', project_id=project.id),
+        ])
+        db.session.commit()
+        yield project.id
+        db.session.execute(db.delete(HouseExpense).where(HouseExpense.project_id == project.id))
+        db.session.delete(project)
+        db.session.commit()
+
+
+def _export(client, **args):
+    response = client.get('/house/expenses/export.csv', query_string=args)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    return list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+
+
+def _rows(client, **args):
+    """The (date, item) of each exported expense, in export order."""
+    header, *rows = _export(client, **args)
+    return [(row[0], row[1]) for row in rows]
+
+
+def test_header_row(client):
+    assert _export(client, project_id=999999) == [EXPORT_COLUMNS]
+
+
+def test_persisted_tax_columns(client, taxed_project_id):
+    rows = [dict(zip(EXPORT_COLUMNS, row)) for row in _export(client, project_id=taxed_project_id)[1:]]
+    assert [(r['item'], r['project'], r['category']) for r in rows] == [
+        ('Entered tax', 'Export project', 'Tools'), ('Default tax', 'Export project', 'Tools'),
+    ]
+    entered, default = rows
+    assert (entered['price'], entered['tax'], entered['effective_tax'], entered['total_with_tax']) == (
+        '12.50', '3.21', '3.21', '15.71')
+    assert (default['price'], default['tax'], default['effective_tax'], default['total_with_tax']) == (
+        '10.00', '', '0.55', '10.55')
+
+
+@pytest.mark.parametrize('args', [
+    {'year': 2023, 'quarter': 2},
+    {'year': 2024, 'month': 3},
+    {'year': 2024, 'quarter': 3, 'month': 7, 'category': 'Materials'},
+])
+def test_tally_filters_match_the_tally(client, args):
+    tally = client.get('/house/api/tally', query_string=args).get_json()
+    assert 0 < tally['count'] < 100
+    shown = sorted((e['date'], e['item']) for e in tally['expenses'])
+    assert sorted(_rows(client, **args)) == shown
+    assert len(shown) == tally['count']
+
+
+def test_list_filters_match_the_expense_list(app, client):
+    with app.app_context():
+        retailer_id = db.session.scalar(db.select(Retailer.id).where(Retailer.name == 'Retailer 4'))
+    args = {'retailer_id': retailer_id, 'start': '2023-02-01', 'end': '2024-09-30'}
+    html = client.get('/house/expenses', query_string=args).get_data(as_text=True)
+    ids = set(int(i) for i in re.findall(r'/house/expenses/(\d+)/edit', html))
+    assert 'id="loadMore"' not in html
+    with app.app_context():
+        shown = db.session.execute(
+            db.select(HouseExpense.expenditure_date, HouseExpense.item).where(HouseExpense.id.in_(ids))
+        ).all()
+    assert ids
+    assert sorted(_rows(client, **args)) == sorted((day.isoformat(), item) for day, item in shown)
@@ -0,0 +1,78 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app import health
+
+
+class FakeQueuePool:
+    def size(self):
+        return 5
+
+    def checkedout(self):
+        return 2
+
+    def checkedin(self):
+        return 3
+
+    def overflow(self):
+        return -3
+
+
+class FakeNullPool:
+    pass
+
+
+def test_healthy(app):
+    response = app.test_client().get('/health')
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body['status'], body['database']) == ('healthy', 'connected')
+    assert body['latency_ms'] >= 0
+    assert body['max_latency_ms'] == app.config['HEALTH_MAX_LATENCY_MS']
+    assert 'class' in body['pool']
+
+
+def test_unreachable(app, monkeypatch):
+    def refuse(engine, timeout_ms):
+        raise OperationalError('SELECT 1', {}, Exception('connection refused'))
+
+    monkeypatch.setattr(health, '_round_trip', refuse)
+    response = app.test_client().get('/health')
+    assert response.status_code == 503
+    body = response.get_json()
+    assert (body['status'], body['database'], body['error']) == ('unhealthy', 'unreachable', 'OperationalError')
+    assert body['latency_ms'] is None
+
+
+def test_timeout(app, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(health, '_round_trip', lambda engine, timeout_ms: release.wait(5) and 1.0)
+    monkeypatch.setitem(app.config, 'HEALTH_TIMEOUT_SECONDS', 0.05)
+    try:
+        response = app.test_client().get('/health')
+    finally:
+        release.set()
+        # Let the stuck check finish so the next one gets the thread
+        health._executor.submit(lambda: None).result(timeout=5)
+    assert response.status_code == 503
+    assert response.get_json()['database'] == 'timeout'
+
+
+def test_over_latency(app, monkeypatch):
+    monkeypatch.setattr(health, '_round_trip', lambda engine, timeout_ms: app.config['HEALTH_MAX_LATENCY_MS'] + 1)
+    response = app.test_client().get('/health')
+    assert response.status_code == 503
+    body = response.get_json()
+    assert (body['status'], body['database']) == ('degraded', 'slow')
+    assert body['latency_ms'] == app.config['HEALTH_MAX_LATENCY_MS'] + 1
+
+
+@pytest.mark.parametrize('pool, expected', [
+    (FakeQueuePool(), {'class': 'FakeQueuePool', 'size': 5, 'checked_out': 2, 'checked_in': 3, 'overflow': -3}),
+    (FakeNullPool(), {'class': 'FakeNullPool'}),
+])
+def test_pool_status(pool, expected):
+    assert health.pool_status(SimpleNamespace(pool=pool)) == expected
@@ -0,0 +1,144 @@
+import io
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+from werkzeug.datastructures import FileStorage
+
+from app import db
+from app.importer import import_expenses, parse_csv, parse_ofx
+from app.models import HouseExpense, HouseProject
+
+OFX = """OFXHEADER:100
+DATA:OFXSGML
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20240305120000[-5:EST]
+<TRNAMT>-42.17
+<NAME>HOME DEPOT #123
+<MEMO>Lumber
+</STMTTRN>
+<STMTTRN>
+<TRNTYPE>CREDIT
+<DTPOSTED>20240306
+<TRNAMT>500.00
+<NAME>PAYMENT THANK YOU
+</STMTTRN>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20240307
+<TRNAMT>-9.99
+<MEMO>Paint rollers
+</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+
+def _rows(text, **kwargs):
+    return list(parse_csv(io.StringIO(text), **kwargs))
+
+
+def _import(app, filename, text, **kwargs):
+    upload = FileStorage(io.BytesIO(text.encode()), filename=filename)
+    with app.app_context():
+        project_id = db.session.scalars(select(HouseProject.id)).first()
+        before = db.session.scalar(select(db.func.max(HouseExpense.id)))
+        result = import_expenses(upload, project_id, **kwargs)
+        imported = db.session.scalars(
+            select(HouseExpense).where(HouseExpense.id > before).order_by(HouseExpense.id)
+        ).all()
+        return result, [(e.expenditure_date, e.item, e.price) for e in imported]
+
+
+# -- Parsers -------------------------------------------------------------------
+
+def test_csv_header_aliases():
+    rows = _rows('Transaction Date,Payee,Amount,Memo\n03/05/2024,Lowes,12.50,Screws\n')
+    assert rows == [(2, {'date': '03/05/2024', 'retailer': 'Lowes', 'amount': '12.50', 'notes': 'Screws',
+                         'charge_sign': 1})]
+
+
+def test_csv_prefers_price_over_amount_and_skips_blank_lines():
+    rows = _rows('date,item,amount,price\n2024-01-02,Tile,99,12.00\n,,,\n2024-01-03,Grout,5,4.00\n')
+    assert [(line, f['amount']) for line, f in rows] == [(2, '12.00'), (4, '4.00')]
+
+
+def test_csv_debit_credit_columns_need_no_sign():
+    rows = _rows('Date,Description,Debit,Credit\n2024-01-02,Tile,12.00,\n2024-01-03,Refund,,12.00\n', charge_sign=-1)
+    assert [f['charge_sign'] for _, f in rows] == [None, None]
+
+
+@pytest.mark.parametrize('text, message', [
+    ('', 'empty'),
+    ('item,amount\nTile,3\n', 'date column'),
+    ('date,notes\n2024-01-02,x\n', 'price or amount'),
+    ('date,amount\n2024-01-02,3\n', 'item, description or payee'),
+])
+def test_csv_without_required_columns(text, message):
+    with pytest.raises(ValueError, match=message):
+        _rows(text)
+
+
+def test_ofx_blocks():
+    transactions = list(parse_ofx(io.StringIO(OFX)))
+    assert [(line, t['TRNAMT']) for line, t in transactions] == [(4, '-42.17'), (11, '500.00'), (17, '-9.99')]
+    assert transactions[0][1]['NAME'] == 'HOME DEPOT #123'
+
+
+# -- Imports -------------------------------------------------------------------
+
+def test_csv_positive_charges_skip_payments(app):
+    result, rows = _import(app, 'card.csv', (
+        'Date,Description,Amount\n'
+        '2024-03-01,Drywall mud,18.40\n'
+        '2024-03-02,PAYMENT THANK YOU,-500.00\n'
+        '2024-03-03,Refund,(7.25)\n'
+    ))
+    assert (result.imported, result.skipped, result.error_count) == (1, 2, 0)
+    assert rows == [(date(2024, 3, 1), 'Drywall mud', Decimal('18.40'))]
+
+
+def test_csv_negative_charges_skip_payments(app):
+    result, rows = _import(app, 'bank.csv', (
+        'Date,Description,Amount\n'
+        '2024-03-01,Drywall mud,-18.40\n'
+        '2024-03-02,PAYMENT THANK YOU,500.00\n'
+    ), charge_sign=-1)
+    assert (result.imported, result.skipped) == (1, 1)
+    assert rows == [(date(2024, 3, 1), 'Drywall mud', Decimal('18.40'))]
+
+
+def test_csv_debit_credit_columns_skip_credits(app):
+    result, rows = _import(app, 'bank.csv', (
+        'Posted Date,Description,Debit,Credit\n'
+        '2024-03-01,Hinges,6.10,\n'
+        '2024-03-02,PAYMENT THANK YOU,,500.00\n'
+        '2024-03-03,Caulk,-4.20,\n'
+    ))
+    assert (result.imported, result.skipped, result.error_count) == (2, 1, 0)
+    assert [(item, price) for _, item, price in rows] == [('Hinges', Decimal('6.10')), ('Caulk', Decimal('4.20'))]
+
+
+def test_csv_bad_rows_are_reported_by_line(app):
+    result, rows = _import(app, 'card.csv', (
+        'date,item,amount,tax\n'
+        '2024-03-01,Sandpaper,7.00,\n'
+        'yesterday,Primer,20.00,\n'
+        '2024-03-03,Rollers,lots,\n'
+        '2024-03-04,Tape,3.00,-1\n'
+        '2024-03-05,,3.00,\n'
+    ))
+    assert result.imported == 1
+    assert [line for line, _ in result.errors] == [3, 4, 5, 6]
+    assert rows == [(date(2024, 3, 1), 'Sandpaper', Decimal('7.00'))]
+
+
+def test_ofx_imports_debits_and_skips_credits(app):
+    result, rows = _import(app, 'statement.ofx', OFX)
+    assert (result.imported, result.skipped, result.error_count) == (2, 1, 0)
+    assert rows == [
+        (date(2024, 3, 5), 'HOME DEPOT #123', Decimal('42.17')),
+        (date(2024, 3, 7), 'Paint rollers', Decimal('9.99')),
+    ]
@@ -0,0 +1,40 @@
+import time
+
+import pytest
+
+from app import db, items
+from app.models import Retailer
+
+
+@pytest.fixture
+def fresh_index(monkeypatch):
+    index = items.ItemIndex()
+    monkeypatch.setattr(items, '_index', index)
+    return index
+
+
+@pytest.mark.parametrize('limit, expected', [(-1, 1), (0, 1), (3, 3), (500, items.MAX_SUGGESTIONS)])
+def test_suggest_clamps_limit(client, fresh_index, limit, expected):
+    response = client.get(f'/house/expenses/suggest-items?q=it&limit={limit}')
+    assert response.status_code == 200
+    assert len(response.get_json()) == expected
+
+
+def test_suggestions_follow_retailer_renames(app, client, fresh_index):
+    with app.app_context():
+        retailer_id = db.session.scalar(db.select(Retailer.id).where(Retailer.name == 'Retailer 10'))
+    assert client.get('/house/expenses/suggest-items?q=Item 100').get_json()[0]['retailer'] == 'Retailer 10'
+    try:
+        client.post(f'/house/retailers/{retailer_id}/edit', data={'name': 'Corner Hardware'})
+        assert client.get('/house/expenses/suggest-items?q=Item 100').get_json()[0]['retailer'] == 'Corner Hardware'
+    finally:
+        client.post(f'/house/retailers/{retailer_id}/edit', data={'name': 'Retailer 10'})
+
+
+def test_warm_in_background_builds_the_index(app, fresh_index):
+    items.warm_in_background(app)
+    deadline = time.monotonic() + 10
+    while fresh_index.synced_at is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert fresh_index.synced_at is not None
+    assert fresh_index.search('item 1', 1)
@@ -0,0 +1,168 @@
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import text
+
+from app import create_app, db
+from app.migrations import MIGRATIONS, upgrade
+from app.models import (
+    ExpenseRollup, HouseExpense, HouseProject, HouseTodo, Retailer, expense_amounts, normalize_retailer_name,
+)
+from config import Config
+
+# The tables as the first release created them, before any migration
+BASELINE_SCHEMA = [
+    '''CREATE TABLE users (
+        id INTEGER NOT NULL, username VARCHAR(50) NOT NULL, email VARCHAR(120),
+        password_hash VARCHAR(255) NOT NULL, created_at DATETIME,
+        PRIMARY KEY (id), UNIQUE (username), UNIQUE (email))''',
+    '''CREATE TABLE retailers (
+        id INTEGER NOT NULL, name VARCHAR(150) NOT NULL, website VARCHAR(255),
+        is_active BOOLEAN NOT NULL, created_at DATETIME, PRIMARY KEY (id))''',
+    '''CREATE TABLE house_projects (
+        id INTEGER NOT NULL, name VARCHAR(150) NOT NULL, description TEXT, status VARCHAR(20) NOT NULL,
+        budget NUMERIC(12, 2), room VARCHAR(100), start_date DATE, estimated_end_date DATE,
+        actual_end_date DATE, is_active BOOLEAN NOT NULL, created_at DATETIME, updated_at DATETIME,
+        PRIMARY KEY (id))''',
+    '''CREATE TABLE house_todos (
+        id INTEGER NOT NULL, title VARCHAR(200) NOT NULL, description TEXT, project_id INTEGER,
+        start_date DATE, due_date DATE, priority VARCHAR(10) NOT NULL, sort_order INTEGER NOT NULL,
+        completed BOOLEAN NOT NULL, completed_at DATETIME, is_active BOOLEAN NOT NULL,
+        created_at DATETIME, updated_at DATETIME,
+        PRIMARY KEY (id), FOREIGN KEY(project_id) REFERENCES house_projects (id))''',
+    '''CREATE TABLE house_expenses (
+        id INTEGER NOT NULL, expenditure_date DATE NOT NULL, entered_date DATE NOT NULL,
+        price NUMERIC(12, 2) NOT NULL, tax NUMERIC(12, 2), item VARCHAR(200) NOT NULL, description TEXT,
+        category VARCHAR(50) NOT NULL, retailer_id INTEGER, project_id INTEGER NOT NULL,
+        is_active BOOLEAN NOT NULL, created_at DATETIME, updated_at DATETIME,
+        PRIMARY KEY (id), FOREIGN KEY(retailer_id) REFERENCES retailers (id),
+        FOREIGN KEY(project_id) REFERENCES house_projects (id))''',
+]
+
+BASELINE_ROWS = [
+    "INSERT INTO retailers VALUES (1, 'The Home Depot #4021', NULL, 1, '2023-01-05 09:00:00')",
+    "INSERT INTO retailers VALUES (2, 'Lowe''s', NULL, 1, NULL)",
+    "INSERT INTO house_projects VALUES (1, 'Kitchen', NULL, 'in-progress', NULL, NULL, NULL, NULL, NULL, 1, "
+    "'2023-01-01 00:00:00', '2023-01-01 00:00:00')",
+    "INSERT INTO house_projects VALUES (2, 'Deck', NULL, 'planning', NULL, NULL, NULL, NULL, NULL, 1, "
+    "'2023-01-01 00:00:00', '2023-01-01 00:00:00')",
+    "INSERT INTO house_expenses VALUES (1, '2023-03-04', '2023-03-04', 42.10, NULL, 'Cabinet hinges', NULL, "
+    "'Materials', 1, 1, 1, NULL, NULL)",
+    "INSERT INTO house_expenses VALUES (2, '2023-03-20', '2023-03-21', 19.99, 1.50, 'Wood glue', NULL, "
+    "'Materials', 1, 1, 1, NULL, NULL)",
+    "INSERT INTO house_expenses VALUES (3, '2023-04-02', '2023-04-02', 250.00, NULL, 'Deck boards', NULL, "
+    "'Materials', NULL, 2, 1, NULL, NULL)",
+    "INSERT INTO house_expenses VALUES (4, '2023-04-09', '2023-04-09', 99.00, NULL, 'Returned saw', NULL, "
+    "'Tools', 2, 2, 0, NULL, NULL)",
+    "INSERT INTO house_todos VALUES (1, 'Order cabinets', NULL, 1, NULL, NULL, 'High', 3, 0, NULL, 1, NULL, NULL)",
+    "INSERT INTO house_todos VALUES (2, 'Seal deck', NULL, 2, NULL, NULL, 'Low', 1, 0, NULL, 1, NULL, NULL)",
+    "INSERT INTO house_todos VALUES (3, 'Buy screws', NULL, NULL, NULL, NULL, 'Medium', 2, 0, NULL, 1, NULL, NULL)",
+    "INSERT INTO house_todos VALUES (4, 'Fix railing', NULL, 2, NULL, NULL, 'Medium', 1, 0, NULL, 1, NULL, NULL)",
+]
+
+
+def _snapshot():
+    """Every schema object and every row of the migrated tables."""
+    schema = db.session.execute(text(
+        "SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%' ORDER BY name"
+    )).all()
+    rows = {
+        model.__tablename__: db.session.execute(db.select(model.__table__).order_by(model.id)).all()
+        for model in (Retailer, HouseProject, HouseExpense, HouseTodo, ExpenseRollup)
+    }
+    return schema, rows
+
+
+@pytest.fixture(scope='module')
+def upgraded(tmp_path_factory):
+    """A baseline database with data, upgraded twice.
+
+    Yields the steps each upgrade() applied and a snapshot after each.
+    """
+    path = tmp_path_factory.mktemp('baseline') / 'budget.db'
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(Config, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{path}')
+        app = create_app()
+    with app.app_context():
+        with db.engine.begin() as conn:
+            for statement in BASELINE_SCHEMA + BASELINE_ROWS:
+                conn.exec_driver_sql(statement)
+        first = upgrade()
+        after_first = _snapshot()
+        second = upgrade()
+        after_second = _snapshot()
+        db.session.commit()
+        yield {'app': app, 'applied': (first, second), 'snapshots': (after_first, after_second)}
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def migrated(upgraded):
+    with upgraded['app'].app_context():
+        yield upgraded
+
+
+def test_each_step_runs_once(migrated):
+    first, second = migrated['applied']
+    assert first == [(version, name) for version, name, _ in sorted(MIGRATIONS, key=lambda m: m[0])]
+    assert second == []
+
+
+def test_second_upgrade_changes_nothing(migrated):
+    after_first, after_second = migrated['snapshots']
+    assert after_second == after_first
+
+
+def test_steps_are_idempotent(migrated):
+    before = _snapshot()
+    for _, _, step in sorted(MIGRATIONS, key=lambda m: m[0]):
+        with db.engine.begin() as conn:
+            step(conn)
+    db.session.commit()
+    assert _snapshot() == before
+
+
+def test_declared_indexes_exist(migrated):
+    existing = set(db.session.scalars(text("SELECT name FROM sqlite_master WHERE type = 'index'")))
+    declared = {
+        index.name
+        for model in (Retailer, HouseProject, HouseExpense, HouseTodo, ExpenseRollup)
+        for index in model.__table__.indexes
+    }
+    assert declared <= existing
+    assert 'uq_expense_rollups_key' in existing
+    assert 'ix_house_todos_active_completed_order' not in existing
+
+
+def test_expense_amounts_are_backfilled(migrated):
+    for expense in db.session.scalars(db.select(HouseExpense)):
+        assert (expense.effective_tax, expense.total_with_tax) == expense_amounts(expense.price, expense.tax)
+    taxed = db.session.get(HouseExpense, 2)
+    assert (taxed.effective_tax, taxed.total_with_tax) == (Decimal('1.50'), Decimal('21.49'))
+
+
+def test_retailer_columns_are_backfilled(migrated):
+    retailers = {r.id: r for r in db.session.scalars(db.select(Retailer))}
+    assert retailers[1].updated_at == datetime(2023, 1, 5, 9)
+    assert retailers[2].updated_at is not None
+    for retailer in retailers.values():
+        assert retailer.normalized_name == normalize_retailer_name(retailer.name)
+
+
+def test_rollups_sum_active_expenses(migrated):
+    rollups = db.session.execute(db.select(
+        ExpenseRollup.year, ExpenseRollup.month, ExpenseRollup.project_id, ExpenseRollup.category,
+        ExpenseRollup.retailer_id, ExpenseRollup.price_cents, ExpenseRollup.tax_cents, ExpenseRollup.expense_count,
+    ).order_by(ExpenseRollup.year, ExpenseRollup.month, ExpenseRollup.project_id)).all()
+    assert [tuple(r) for r in rollups] == [
+        (2023, 3, 1, 'Materials', 1, 6209, 382, 2),
+        (2023, 4, 2, 'Materials', None, 25000, 1375, 1),
+    ]
+
+
+def test_todo_ranks_follow_sort_order(migrated):
+    todos = db.session.scalars(db.select(HouseTodo).order_by(HouseTodo.rank)).all()
+    assert [t.id for t in todos] == [2, 4, 3, 1]
+    assert len({t.rank for t in todos}) == len(todos)
@@ -0,0 +1,35 @@
+"""The main pages run a fixed number of queries, however many rows they show."""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app import db
+
+# Well under the number of projects and retailers seeded in conftest.py, so a
+# query per row on any of these pages fails the test
+MAX_QUERIES = 15
+
+
+@contextmanager
+def count_queries(app):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+
+
+@pytest.mark.parametrize('path', ['/house/', '/house/expenses', '/house/projects', '/house/retailers'])
+def test_page_query_count_is_bounded(app, client, path):
+    with count_queries(app) as statements:
+        response = client.get(path)
+    assert response.status_code == 200
+    assert len(statements) <= MAX_QUERIES, '\n'.join(statements)
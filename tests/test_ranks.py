@@ -0,0 +1,62 @@
+import random
+
+import pytest
+
+from app.ranks import MAX_RANK_LENGTH, rank_after, rank_between, rank_sequence
+
+
+def test_appends_stay_ordered_and_short():
+    key, keys = None, []
+    for _ in range(100_000):
+        key = rank_after(key)
+        keys.append(key)
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
+    assert not any(k.endswith('0') for k in keys)
+    assert len(keys[2_300 - 1]) <= 5
+    assert len(keys[-1]) <= 7
+
+
+def test_appends_after_a_rebalance():
+    key = rank_sequence(500)[-1]
+    for _ in range(10_000):
+        following = rank_after(key)
+        assert following > key
+        key = following
+    assert len(key) < MAX_RANK_LENGTH
+
+
+@pytest.mark.parametrize('lower, upper', [
+    (None, None), (None, '1'), ('1', None), ('a', 'b'), ('a', 'a1'), ('az', 'b'), ('zz', None), ('a1', 'a11'),
+])
+def test_rank_between_is_strictly_between(lower, upper):
+    key = rank_between(lower, upper)
+    assert (lower or '') < key
+    assert upper is None or key < upper
+    assert not key.endswith('0')
+
+
+def test_rank_between_rejects_unordered_bounds():
+    with pytest.raises(ValueError):
+        rank_between('b', 'a')
+
+
+def test_repeated_inserts_grow_one_digit_per_few_moves():
+    # Always inserting just above the same key is the worst case for moves
+    lower, upper = 'a', 'b'
+    for _ in range(100):
+        upper = rank_between(lower, upper)
+        assert lower < upper
+    assert len(upper) <= 100 // 5 + 2
+
+
+def test_random_moves_keep_every_key_ordered():
+    rnd = random.Random(7)
+    keys = rank_sequence(50)
+    for _ in range(2_000):
+        i = rnd.randrange(len(keys) + 1)
+        lower = keys[i - 1] if i else None
+        upper = keys[i] if i < len(keys) else None
+        keys.insert(i, rank_between(lower, upper))
+    assert keys == sorted(keys)
+    assert len(set(keys)) == len(keys)
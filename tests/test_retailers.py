@@ -0,0 +1,10 @@
+import pytest
+
+from app.retailers import MAX_MATCHES
+
+
+@pytest.mark.parametrize('limit, expected', [(-1, 1), (0, 1), (3, 3), (500, MAX_MATCHES)])
+def test_suggest_clamps_limit(client, limit, expected):
+    response = client.get(f'/house/retailers/suggest?q=retailer&limit={limit}')
+    assert response.status_code == 200
+    assert len(response.get_json()) == expected
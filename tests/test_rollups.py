@@ -0,0 +1,35 @@
+import pytest
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app import db, rollups
+from app.models import ExpenseRollup, HouseProject
+
+KEY_YEAR = 2099
+
+
+def _key(project_id):
+    return {'year': KEY_YEAR, 'month': 1, 'project_id': project_id, 'category': 'Materials', 'retailer_id': None}
+
+
+@pytest.fixture
+def project_id(app):
+    with app.app_context():
+        yield db.session.scalars(select(HouseProject.id)).first()
+        db.session.rollback()
+
+
+def test_key_without_retailer_is_unique(project_id):
+    with pytest.raises(IntegrityError):
+        db.session.execute(ExpenseRollup.__table__.insert(), [_key(project_id), _key(project_id)])
+
+
+def test_deltas_for_one_key_share_one_row(project_id):
+    key = tuple(_key(project_id).values())
+    rollups.apply_deltas({key: (1000, 55, 1)})
+    rollups.apply_deltas({key: (250, 14, 1)})
+    rows = db.session.execute(
+        select(ExpenseRollup.price_cents, ExpenseRollup.tax_cents, ExpenseRollup.expense_count)
+        .where(ExpenseRollup.year == KEY_YEAR)
+    ).all()
+    assert [tuple(row) for row in rows] == [(1250, 69, 2)]
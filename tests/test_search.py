@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy import func
+
+from app import db, search
+from app.models import HouseExpense, HouseProject
+
+
+@pytest.fixture
+def drywall(app, client):
+    with app.app_context():
+        project_id = db.session.scalars(db.select(HouseProject.id)).first()
+    client.post('/house/expenses/add', data={
+        'expenditure_date': '2024-02-10', 'item': 'Drywall sheets', 'price': '42.00', 'category': 'Materials',
+        'description': 'Half-inch gypsum board for the basement', 'project_id': project_id,
+    })
+    with app.app_context():
+        expense_id = db.session.scalar(db.select(func.max(HouseExpense.id)))
+    yield expense_id
+    client.post(f'/house/expenses/{expense_id}/delete')
+
+
+@pytest.mark.parametrize('query', ['drywall sheet', 'drywall sheets', 'gypsum board basem', 'DRYWALL  Sheet!'])
+def test_multi_word_query_matches_every_term(app, drywall, query):
+    with app.app_context():
+        results, _ = search.search(query)
+    assert [(r.kind, r.ref_id) for r in results] == [('expense', drywall)]
+
+
+def test_multi_word_query_needs_every_term(app, drywall):
+    with app.app_context():
+        results, _ = search.search('drywall plywood')
+    assert results == []
+
+
+def test_search_page_with_multi_word_query(client, drywall):
+    response = client.get('/search/?q=drywall+sheet')
+    assert response.status_code == 200
+    assert b'<mark>' in response.data
@@ -0,0 +1,19 @@
+import pytest
+from flask import g
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.sqlstats import QueryStats
+
+
+def test_failed_statement_is_counted_and_releases_its_timer(app):
+    with app.test_request_context():
+        g.sql_stats = QueryStats()
+        with pytest.raises(OperationalError):
+            db.session.execute(text('SELECT * FROM no_such_table'))
+        connection = db.session.connection()
+        assert connection.info.get('sql_stats_started') == []
+        db.session.execute(text('SELECT 1'))
+        assert g.sql_stats.count == 2
+        db.session.rollback()
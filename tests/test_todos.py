@@ -0,0 +1,40 @@
+import pytest
+
+from app import db
+from app.models import HouseTodo
+from app.ranks import MAX_RANK_LENGTH, rank_sequence
+
+
+@pytest.fixture
+def todo_id(app):
+    with app.app_context():
+        todo = HouseTodo(title='Patch the ceiling', sort_order=0, rank=rank_sequence(1)[0])
+        db.session.add(todo)
+        db.session.commit()
+        yield todo.id
+        db.session.delete(todo)
+        db.session.commit()
+
+
+@pytest.mark.parametrize('body', [{'after_id': 'abc'}, {'before_id': '2.5'}, {'after_id': [1]}])
+def test_move_rejects_non_integer_anchor(client, todo_id, body):
+    response = client.post(f'/house/todos/{todo_id}/move', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_add_schedules_a_rebalance_for_long_ranks(app, client, monkeypatch):
+    scheduled = []
+    monkeypatch.setattr('app.routes.todos.schedule_rebalance', scheduled.append)
+    with app.app_context():
+        last = HouseTodo(title='Sand the trim', sort_order=0, rank='z' * MAX_RANK_LENGTH)
+        db.session.add(last)
+        db.session.commit()
+    try:
+        response = client.post('/house/todos/add', data={'title': 'Paint the trim', 'priority': 'Medium'})
+        assert response.status_code == 302
+        assert scheduled == [app]
+    finally:
+        with app.app_context():
+            db.session.execute(db.delete(HouseTodo).where(HouseTodo.title.in_(['Sand the trim', 'Paint the trim'])))
+            db.session.commit()